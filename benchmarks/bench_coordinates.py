@@ -0,0 +1,67 @@
+import math
+import random
+import timeit
+
+from services.coordinates import decode_pos_list, decode_coordinates
+
+
+def legacy_extract_coordinates(coord_text: str) -> list:
+    coords = []
+    coord_text = coord_text.strip()
+
+    if ',' in coord_text:
+        coord_pairs = coord_text.split()
+        for pair in coord_pairs:
+            if ',' in pair:
+                parts = pair.split(',')
+                if len(parts) >= 2:
+                    try:
+                        x = float(parts[0])
+                        y = float(parts[1])
+                        coords.append([x, y])
+                    except ValueError:
+                        continue
+    else:
+        coord_pairs = coord_text.split()
+        for i in range(0, len(coord_pairs), 2):
+            if i + 1 < len(coord_pairs):
+                try:
+                    x = float(coord_pairs[i])
+                    y = float(coord_pairs[i + 1])
+                    coords.append([x, y])
+                except ValueError:
+                    continue
+    return coords
+
+
+def make_ring(vertices: int) -> list:
+    rnd = random.Random(vertices)
+    cx, cy = 566000.0, 244000.0
+    ring = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        radius = 150 + rnd.uniform(-5, 5)
+        ring.append((round(cx + radius * math.cos(angle), 2), round(cy + radius * math.sin(angle), 2)))
+    ring.append(ring[0])
+    return ring
+
+
+def main():
+    print(f"{'vertices':>9} {'format':>12} {'legacy ms':>10} {'decoder ms':>11} {'speedup':>8}")
+    for vertices in (100, 1000, 10000, 100000):
+        ring = make_ring(vertices)
+        pos_list = ' '.join(f"{x} {y}" for x, y in ring)
+        coordinates = ' '.join(f"{x},{y}" for x, y in ring)
+        number = max(1, 200000 // vertices)
+
+        for label, text, decode in (
+                ('posList', pos_list, decode_pos_list),
+                ('coordinates', coordinates, decode_coordinates)
+        ):
+            legacy = timeit.timeit(lambda: legacy_extract_coordinates(text), number=number) / number
+            current = timeit.timeit(lambda: decode(text), number=number) / number
+            print(f"{vertices:>9} {label:>12} {legacy * 1000:>10.3f} {current * 1000:>11.3f} {legacy / current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
 class Settings:
     WFS_DATA_FILE = "data/dane_WFS.txt"
+    REGISTRY_CHECK_INTERVAL = 5
     REQUEST_TIMEOUT = 30
     MAX_FEATURES = 1000
 
+    HTTP_MAX_CONNECTIONS = 200
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = 100
+    HTTP_MAX_CONNECTIONS_PER_HOST = 8
+    HTTP_KEEPALIVE_EXPIRY = 60
+    HTTP2 = False
+
     PARCEL_LAYER_NAMES = [
         'ewns:dzialki',
         'dzialki',
@@ -29,5 +36,68 @@ class Settings:
 
     WFS_VERSIONS = ['2.0.0', '1.1.0', '1.0.0']
 
+    PREWARM_CRS = ['EPSG:2176', 'EPSG:2177', 'EPSG:2178', 'EPSG:2179', 'EPSG:2180']
+
+    WFS_SEARCH_MODE = 'concurrent'
+    WFS_PROBE_CONCURRENCY = 8
+
+    CAPABILITIES_PROBE = True
+    CAPABILITIES_TTL = 24 * 3600
+    CAPABILITIES_FAILURE_TTL = 300
+
+    BATCH_MAX_IDS = 1000
+    BATCH_FILTER_SIZE = 50
+    BATCH_FILTER_MAX_URL_LENGTH = 6000
+    BATCH_DISCOVERY_ATTEMPTS = 3
+    BATCH_SERVICE_CONCURRENCY = 8
+    STREAM_MAX_IDS = 100000
+    STREAM_QUEUE_SIZE = 64
+
+    BBOX_MAX_AREA = 0.01
+    BBOX_PAGE_SIZE = 500
+    BBOX_PAGE_CONCURRENCY = 4
+    BBOX_MAX_FEATURES = 50000
+    BBOX_CAPABILITIES_CONCURRENCY = 16
+    EXTENT_INDEX_FILE = "data/extent_index.json"
+
+    MIRROR_DIR = "data/mirror"
+    MIRROR_PAGE_SIZE = 1000
+    MIRROR_SCAN_INTERVAL = 60
+
+    POINT_SEARCH_RADIUS = 0.0005
+    POINT_INDEX_MAX_FEATURES = 50000
+    POINT_INDEX_REBUILD_THRESHOLD = 256
+
+    TILE_MIN_ZOOM = 15
+    TILE_BUFFER = 64
+    TILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    TILE_MAX_AGE = 3600
+
+    COMPRESSION_MIN_SIZE = 1024
+    COMPRESSION_GZIP_LEVEL = 6
+    COMPRESSION_BROTLI_QUALITY = 4
+
+    LOOKUP_CACHE_MAX_ENTRIES = 10000
+    LOOKUP_CACHE_TTL = 6 * 3600
+    LOOKUP_CACHE_STALE_TTL = 24 * 3600
+    LOOKUP_CACHE_DISK_PATH = None
+    NEGATIVE_CACHE_TTL = 300
+
+    EXPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    SIMPLIFY_CACHE_MAX_ENTRIES = 20000
+    SIMPLIFY_SEARCH_STEPS = 24
+
+    CIRCUIT_FAILURE_THRESHOLD = 5
+    CIRCUIT_RESET_TIMEOUT = 30
+    ADAPTIVE_TIMEOUT_MIN = 5
+    ADAPTIVE_TIMEOUT_MULTIPLIER = 4
+
+    LAYER_CACHE_FILE = "data/layer_cache.json"
+    CRS_CACHE_FILE = "data/crs_cache.json"
+    LAYER_CACHE_MAX_MISSES = 3
+
+    LOG_LEVEL = "WARNING"
+    LOG_FORMAT = "%(asctime)s level=%(levelname)s logger=%(name)s %(message)s"
+
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,39 @@
+import argparse
+import asyncio
+import logging
+
+from config import settings
+from services.harvest_service import harvest
+from services.http_client import start_client, close_client
+from utils import get_registry
+
+
+async def run(teryts, entity_types):
+    get_registry(settings.WFS_DATA_FILE).reload()
+    await start_client()
+    try:
+        for teryt in teryts:
+            for stats in await harvest(teryt, entity_types):
+                status = "" if stats['complete'] else " (incomplete, sync left open)"
+                print(f"{teryt} {stats['entity_type']} {stats['layer']}: "
+                      f"{stats['changed']} changed, {stats['unchanged']} unchanged, {stats['removed']} removed"
+                      f"{status}")
+    finally:
+        await close_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mirror a powiat's parcel and building layers into local SQLite")
+    parser.add_argument("teryt", nargs="+", help="4-digit powiat TERYT code(s) to harvest")
+    parser.add_argument("--type", choices=["parcel", "building", "all"], default="all",
+                        help="Entity type to harvest (default: all)")
+    parser.add_argument("--verbose", action="store_true", help="Log each harvested page")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else settings.LOG_LEVEL, format=settings.LOG_FORMAT)
+    entity_types = ["parcel", "building"] if args.type == "all" else [args.type]
+    asyncio.run(run(args.teryt, entity_types))
+
+
+if __name__ == "__main__":
+    main()
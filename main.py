@@ -1,9 +1,33 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 import urllib3
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 
-from routers import parcels, buildings
+from config import settings
+from routers import parcels, buildings, tiles
+from services.bbox_service import schedule_extent_refresh, stop_extent_refresh
+from services.geometry_service import prewarm_transformers
+from services.http_client import start_client, close_client
+from services.mirror import scan_mirrors
+from utils import get_registry, render_metrics, CompressionMiddleware
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+logging.basicConfig(level=settings.LOG_LEVEL, format=settings.LOG_FORMAT)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_registry(settings.WFS_DATA_FILE).reload()
+    await asyncio.get_event_loop().run_in_executor(None, prewarm_transformers)
+    await asyncio.get_event_loop().run_in_executor(None, scan_mirrors)
+    await start_client()
+    schedule_extent_refresh()
+    yield
+    await stop_extent_refresh()
+    await close_client()
 
 app = FastAPI(
     title="PlotAPI",
@@ -12,11 +36,20 @@ app = FastAPI(
     contact={
         "name": "ernestilchenko",
         "url": "https://github.com/ernestilchenko"
-    }
+    },
+    lifespan=lifespan
+)
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY
 )
 
 app.include_router(parcels.router, prefix="/api", tags=["Parcels"])
 app.include_router(buildings.router, prefix="/api", tags=["Buildings"])
+app.include_router(tiles.router, prefix="/api", tags=["Tiles"])
 
 
 @app.get("/")
@@ -26,16 +59,25 @@ async def root():
         "version": "1.1.0",
         "endpoints": {
             "parcels": "/api/parcel_by_id/",
-            "buildings": "/api/building_by_id/"
+            "buildings": "/api/building_by_id/",
+            "parcels_in_bbox": "/api/parcels_by_bbox/",
+            "buildings_in_bbox": "/api/buildings_by_bbox/",
+            "tiles": "/api/tiles/{z}/{x}/{y}.mvt"
         },
         "usage": {
             "search": "Add parcel_id or building_id parameter",
-            "download": "Add format parameter (geojson, gml, kml, shp) to download file"
+            "download": "Add format parameter (geojson, gml, kml, shp, gpkg, fgb, parquet) to download file",
+            "shapefile": "shp exports are staged in a temporary directory; all other formats are built in memory"
         },
-        "supported_formats": ["geojson", "gml", "kml", "shp"]
+        "supported_formats": ["geojson", "gml", "kml", "shp", "gpkg", "fgb", "parquet"]
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
 
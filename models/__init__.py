@@ -5,5 +5,8 @@ from .responses import (
     ServiceInfo,
     GeometryResponse,
     ParcelData,
-    BuildingData
+    BuildingData,
+    BatchLookupRequest,
+    BatchItemResult,
+    BatchResponse
 )
\ No newline at end of file
@@ -1,4 +1,4 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Union
 
 from pydantic import BaseModel
 
@@ -39,5 +39,25 @@ class BuildingResponse(BaseModel):
     data: BuildingData
 
 
+class BatchLookupRequest(BaseModel):
+    ids: List[str]
+
+
+class BatchItemResult(BaseModel):
+    id: str
+    status: str
+    teryt: str
+    service: Optional[ServiceInfo] = None
+    data: Optional[Union[ParcelData, BuildingData]] = None
+    error: Optional[str] = None
+
+
+class BatchResponse(BaseModel):
+    status: str
+    requested: int
+    found: int
+    results: List[BatchItemResult]
+
+
 class ErrorResponse(BaseModel):
     detail: str
@@ -1,22 +1,62 @@
-from typing import Optional
+from typing import Optional, Dict, Any
 
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import Response
+from fastapi import APIRouter, HTTPException, Query, Header
+from fastapi.responses import Response, StreamingResponse
 
 from config import settings
-from models import ParcelResponse, ErrorResponse, ParcelData, ServiceInfo
-from services import get_parcel_by_id
-from services.export_service import get_export_data
-from utils import get_teryt_from_id, find_service_by_teryt
+from models import ParcelResponse, ErrorResponse, BatchLookupRequest, BatchResponse
+from services import (
+    get_parcel_by_id, lookup_batch, stream_batch, iter_bbox, find_by_point, UpstreamUnavailableError
+)
+from services.export_cache import export_cache, etag_matches
+from services.export_service import (
+    get_export_data, get_batch_export_data, stream_export, stream_export_headers, stream_feature_collection,
+    STREAM_FORMATS
+)
+from services.geometry_service import round_geometry
+from services.simplify_cache import lod_variant, simplify_data, simplify_item, simplify_items, simplify_features
+from utils import get_teryt_from_id, find_service_by_teryt, parse_bbox, FastJSONResponse
 
 router = APIRouter()
 
+PRECISION_DESCRIPTION = "Round WGS84 coordinates in JSON responses to this many decimals"
+SIMPLIFY_DESCRIPTION = "Topology-preserving simplification tolerance in degrees"
+MAX_VERTICES_DESCRIPTION = "Simplify each geometry until it has at most this many vertices"
+SHAPEFILE_NOTE = "shp is staged in a temporary directory because GDAL cannot write shapefiles in memory"
 
-@router.get("/parcel_by_id/", response_model=None, responses={404: {"model": ErrorResponse}})
+
+def _service_info(service: Dict[str, str]) -> Dict[str, str]:
+    return {'organization': service['organization'], 'url': service['url']}
+
+
+def _parcel_data(parcel: Dict[str, Any], precision: Optional[int]) -> Dict[str, Any]:
+    return {'attributes': parcel['attributes'], 'geometry': round_geometry(parcel['geometry'], precision)}
+
+
+def _parcel_response(service: Dict[str, str], parcel_id: str, parcel: Dict[str, Any],
+                     precision: Optional[int]) -> FastJSONResponse:
+    return FastJSONResponse({
+        'status': 'success',
+        'parcel_id': parcel_id,
+        'teryt': get_teryt_from_id(parcel_id),
+        'service': _service_info(service),
+        'data': _parcel_data(parcel, precision)
+    })
+
+
+@router.get("/parcel_by_id/", response_model=None,
+            responses={200: {"model": ParcelResponse}, 304: {"description": "Export not modified"},
+                       404: {"model": ErrorResponse},
+                       503: {"model": ErrorResponse}})
 async def search_parcel_by_id(
         parcel_id: str = Query(..., description="Parcel ID to search for"),
-        format: Optional[str] = Query(None, description="Export format: geojson, gml, kml, shp",
-                                      regex="^(geojson|gml|kml|shp)$")
+        format: Optional[str] = Query(None, description="Export format: geojson, gml, kml, shp, gpkg, fgb, parquet; "
+                                                        + SHAPEFILE_NOTE,
+                                      regex="^(geojson|gml|kml|shp|gpkg|fgb|parquet)$"),
+        precision: Optional[int] = Query(None, ge=0, le=15, description=PRECISION_DESCRIPTION),
+        simplify: Optional[float] = Query(None, gt=0, description=SIMPLIFY_DESCRIPTION),
+        max_vertices: Optional[int] = Query(None, ge=4, description=MAX_VERTICES_DESCRIPTION),
+        if_none_match: Optional[str] = Header(None)
 ):
     teryt = get_teryt_from_id(parcel_id)
     service = await find_service_by_teryt(settings.WFS_DATA_FILE, teryt)
@@ -24,34 +64,142 @@ async def search_parcel_by_id(
     if not service:
         raise HTTPException(status_code=404, detail=f"No WFS service found for TERYT code: {teryt}")
 
-    parcel = await get_parcel_by_id(service['url'], parcel_id)
+    variant = lod_variant(simplify, max_vertices)
+    if format:
+        etag = export_cache.etag_for(service['url'], "parcel", parcel_id, format, variant)
+        if etag and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+    try:
+        parcel = await get_parcel_by_id(service['url'], parcel_id)
+    except UpstreamUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     if not parcel:
         raise HTTPException(status_code=404, detail=f"Parcel with ID {parcel_id} not found in any available layer")
+    parcel = simplify_data(service['url'], "parcel", parcel_id, parcel, simplify, max_vertices)
 
     if format:
         try:
-            content, media_type, filename = await get_export_data(parcel, parcel_id, "parcel", format)
+            content, media_type, filename, etag = await get_export_data(parcel, parcel_id, "parcel", format)
+            export_cache.remember_etag(service['url'], "parcel", parcel_id, format, etag, variant)
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={"ETag": etag})
 
             return Response(
                 content=content,
                 media_type=media_type,
-                headers={"Content-Disposition": f"attachment; filename={filename}"}
+                headers={"Content-Disposition": f"attachment; filename={filename}", "ETag": etag}
             )
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
 
-    return ParcelResponse(
-        status="success",
-        parcel_id=parcel_id,
-        teryt=teryt,
-        service=ServiceInfo(
-            organization=service['organization'],
-            url=service['url']
-        ),
-        data=ParcelData(
-            attributes={**parcel['attributes']},
-            geometry=parcel['geometry']
+    return _parcel_response(service, parcel_id, parcel, precision)
+
+
+@router.post("/parcels_by_ids/", response_model=None,
+             responses={200: {"model": BatchResponse}, 400: {"model": ErrorResponse}, 404: {"model": ErrorResponse}})
+async def search_parcels_by_ids(
+        request: BatchLookupRequest,
+        format: Optional[str] = Query(None, description="Export format: geojson, gml, kml, shp, gpkg, fgb, parquet, "
+                                                        "or streamed geojsonseq, ndjson; " + SHAPEFILE_NOTE,
+                                      regex="^(geojson|gml|kml|shp|gpkg|fgb|parquet|geojsonseq|ndjson)$"),
+        precision: Optional[int] = Query(None, ge=0, le=15, description=PRECISION_DESCRIPTION),
+        simplify: Optional[float] = Query(None, gt=0, description=SIMPLIFY_DESCRIPTION),
+        max_vertices: Optional[int] = Query(None, ge=4, description=MAX_VERTICES_DESCRIPTION)
+):
+    streaming = format in STREAM_FORMATS
+    max_ids = settings.STREAM_MAX_IDS if streaming else settings.BATCH_MAX_IDS
+    if not request.ids:
+        raise HTTPException(status_code=400, detail="No parcel IDs provided")
+    if len(request.ids) > max_ids:
+        raise HTTPException(status_code=400, detail=f"Too many IDs, maximum is {max_ids}")
+
+    if streaming:
+        media_type, filename = stream_export_headers("parcel", format)
+        return StreamingResponse(
+            stream_export(simplify_items(stream_batch("parcel", request.ids), "parcel", simplify, max_vertices),
+                          "parcel", format),
+            media_type=media_type,
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
+
+    items = await lookup_batch("parcel", request.ids)
+    items = [simplify_item(item, "parcel", simplify, max_vertices) for item in items]
+
+    if format:
+        if not any(item['data'] for item in items):
+            raise HTTPException(status_code=404, detail="None of the requested parcels were found")
+        try:
+            content, media_type, filename, etag = await get_batch_export_data(items, "parcel", format)
+
+            return Response(
+                content=content,
+                media_type=media_type,
+                headers={"Content-Disposition": f"attachment; filename={filename}", "ETag": etag}
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
+
+    results = [
+        {
+            'id': item['id'],
+            'status': "success" if item['data'] else "error",
+            'teryt': item['teryt'],
+            'service': _service_info(item['service']) if item['service'] else None,
+            'data': _parcel_data(item['data'], precision) if item['data'] else None,
+            'error': item['error']
+        }
+        for item in items
+    ]
+
+    return FastJSONResponse({
+        'status': "success",
+        'requested': len(results),
+        'found': sum(1 for r in results if r['data']),
+        'results': results
+    })
+
+
+@router.get("/parcels_by_bbox/", response_model=None, responses={400: {"model": ErrorResponse}})
+async def search_parcels_by_bbox(
+        bbox: str = Query(..., description="WGS84 bounding box: minx,miny,maxx,maxy"),
+        precision: Optional[int] = Query(None, ge=0, le=15, description=PRECISION_DESCRIPTION),
+        simplify: Optional[float] = Query(None, gt=0, description=SIMPLIFY_DESCRIPTION),
+        max_vertices: Optional[int] = Query(None, ge=4, description=MAX_VERTICES_DESCRIPTION)
+):
+    try:
+        extent = parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if (extent[2] - extent[0]) * (extent[3] - extent[1]) > settings.BBOX_MAX_AREA:
+        raise HTTPException(status_code=400,
+                            detail=f"bbox too large, maximum area is {settings.BBOX_MAX_AREA} square degrees")
+
+    return StreamingResponse(
+        stream_feature_collection(
+            simplify_features(iter_bbox("parcel", extent), "parcel", simplify, max_vertices), "parcel", precision
+        ),
+        media_type="application/geo+json"
     )
+
+
+@router.get("/parcel_by_point/", response_model=None,
+            responses={200: {"model": ParcelResponse}, 404: {"model": ErrorResponse}})
+async def search_parcel_by_point(
+        lat: float = Query(..., ge=-90, le=90, description="Latitude (WGS84)"),
+        lon: float = Query(..., ge=-180, le=180, description="Longitude (WGS84)"),
+        precision: Optional[int] = Query(None, ge=0, le=15, description=PRECISION_DESCRIPTION),
+        simplify: Optional[float] = Query(None, gt=0, description=SIMPLIFY_DESCRIPTION),
+        max_vertices: Optional[int] = Query(None, ge=4, description=MAX_VERTICES_DESCRIPTION)
+):
+    found = await find_by_point("parcel", lon, lat)
+    if not found:
+        raise HTTPException(status_code=404, detail=f"No parcel found at {lat}, {lon}")
+
+    service, parcel_id, parcel = found
+    parcel = simplify_data(service['url'], "parcel", parcel_id, parcel, simplify, max_vertices)
+    return _parcel_response(service, parcel_id, parcel, precision)
@@ -0,0 +1,33 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Path
+from fastapi.responses import Response
+
+from config import settings
+from services.tile_service import get_tile, TILE_LAYERS
+
+router = APIRouter()
+
+
+@router.get("/tiles/{z}/{x}/{y}.mvt", response_class=Response,
+            responses={200: {"content": {"application/vnd.mapbox-vector-tile": {}}}})
+async def get_vector_tile(
+        z: int = Path(..., ge=0, le=24, description="Zoom level"),
+        x: int = Path(..., ge=0, description="Tile column"),
+        y: int = Path(..., ge=0, description="Tile row"),
+        layers: Optional[str] = Query(None, description="Comma-separated layers: parcels, buildings")
+):
+    if x >= 2 ** z or y >= 2 ** z:
+        raise HTTPException(status_code=400, detail=f"Tile {x}/{y} is outside zoom level {z}")
+
+    names = tuple(n.strip() for n in layers.split(',') if n.strip()) if layers else tuple(TILE_LAYERS)
+    unknown = [n for n in names if n not in TILE_LAYERS]
+    if unknown or not names:
+        raise HTTPException(status_code=400, detail=f"Unknown tile layers: {', '.join(unknown) or layers}")
+
+    tile, complete = await get_tile(z, x, y, tuple(dict.fromkeys(names)))
+    return Response(
+        content=tile,
+        media_type="application/vnd.mapbox-vector-tile",
+        headers={"Cache-Control": f"public, max-age={settings.TILE_MAX_AGE}" if complete else "no-store"}
+    )
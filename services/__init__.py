@@ -1,2 +1,6 @@
 from .geometry_service import parse_gml_geometry_to_geojson
-from .wfs_service import get_parcel_by_id, get_building_by_id
+from .wfs_service import get_parcel_by_id, get_building_by_id, get_parcels_by_ids, get_buildings_by_ids
+from .batch_service import lookup_batch, stream_batch
+from .bbox_service import iter_bbox
+from .point_service import find_by_point
+from .upstream_health import UpstreamUnavailableError
@@ -0,0 +1,97 @@
+import asyncio
+from contextlib import aclosing
+from typing import Dict, Any, List, AsyncIterator, Optional
+
+from config import settings
+from utils import get_teryt_from_id, get_registry
+from utils.metrics import registry_lookup_seconds
+from .wfs_service import get_parcels_by_ids, get_buildings_by_ids, iter_parcels_by_ids, iter_buildings_by_ids
+
+
+async def lookup_batch(entity_type: str, ids: List[str]) -> List[Dict[str, Any]]:
+    groups: Dict[str, List[str]] = {}
+    for entity_id in dict.fromkeys(ids):
+        groups.setdefault(get_teryt_from_id(entity_id), []).append(entity_id)
+
+    registry = get_registry(settings.WFS_DATA_FILE)
+    search = get_buildings_by_ids if entity_type == 'building' else get_parcels_by_ids
+    sem = asyncio.Semaphore(settings.BATCH_SERVICE_CONCURRENCY)
+
+    async def resolve(teryt: str, group: List[str]) -> List[Dict[str, Any]]:
+        with registry_lookup_seconds.time():
+            service = registry.first_service(teryt)
+        if not service:
+            error = f"No WFS service found for TERYT code: {teryt}"
+            return [{'id': e, 'teryt': teryt, 'service': None, 'data': None, 'error': error} for e in group]
+
+        async with sem:
+            found, errors = await search(service['url'], group)
+
+        items = []
+        for e in group:
+            error = None
+            if e not in found:
+                error = errors.get(e, f"{entity_type.capitalize()} with ID {e} not found in any available layer")
+            items.append({'id': e, 'teryt': teryt, 'service': service, 'data': found.get(e), 'error': error})
+        return items
+
+    resolved = await asyncio.gather(*(resolve(t, g) for t, g in groups.items()))
+    by_id = {item['id']: item for items in resolved for item in items}
+    return [by_id[e] for e in dict.fromkeys(ids)]
+
+
+async def stream_batch(entity_type: str, ids: List[str]) -> AsyncIterator[Dict[str, Any]]:
+    groups: Dict[str, List[str]] = {}
+    for entity_id in dict.fromkeys(ids):
+        groups.setdefault(get_teryt_from_id(entity_id), []).append(entity_id)
+
+    registry = get_registry(settings.WFS_DATA_FILE)
+    search = iter_buildings_by_ids if entity_type == 'building' else iter_parcels_by_ids
+    sem = asyncio.Semaphore(settings.BATCH_SERVICE_CONCURRENCY)
+    queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=settings.STREAM_QUEUE_SIZE)
+
+    async def resolve(teryt: str, group: List[str], service: Dict[str, str]) -> None:
+        seen = set()
+        try:
+            async with sem:
+                async with aclosing(search(service['url'], group)) as results:
+                    async for e, data, error in results:
+                        seen.add(e)
+                        await queue.put({'id': e, 'teryt': teryt, 'service': service, 'data': data, 'error': error})
+        except Exception as exc:
+            error = f"Upstream WFS request failed: {exc}"
+            for e in group:
+                if e not in seen:
+                    seen.add(e)
+                    await queue.put({'id': e, 'teryt': teryt, 'service': service, 'data': None, 'error': error})
+        for e in group:
+            if e not in seen:
+                error = f"{entity_type.capitalize()} with ID {e} not found in any available layer"
+                await queue.put({'id': e, 'teryt': teryt, 'service': service, 'data': None, 'error': error})
+
+    tasks = []
+    for teryt, group in groups.items():
+        service = registry.first_service(teryt)
+        if not service:
+            error = f"No WFS service found for TERYT code: {teryt}"
+            for e in group:
+                yield {'id': e, 'teryt': teryt, 'service': None, 'data': None, 'error': error}
+            continue
+        tasks.append(asyncio.create_task(resolve(teryt, group, service)))
+
+    async def finish() -> None:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await queue.put(None)
+
+    done = asyncio.create_task(finish())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield item
+    finally:
+        for t in tasks:
+            t.cancel()
+        done.cancel()
+        await asyncio.gather(*tasks, done, return_exceptions=True)
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import re
+from contextlib import aclosing
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
+
+import pyproj
+
+from config import settings
+from utils import get_registry
+from .capabilities import get_capabilities, matching_feature_types
+from .crs_cache import crs_cache
+from .extent_index import extent_index, bbox_intersects
+from .geometry_service import get_transformer
+from .layer_cache import layer_cache
+from .wfs_service import iter_bbox_features
+
+logger = logging.getLogger(__name__)
+
+Bbox = Tuple[float, float, float, float]
+
+_EPSG_RE = re.compile(r'(\d{4,5})\s*$')
+
+
+def _epsg(name: Optional[str]) -> Optional[str]:
+    match = _EPSG_RE.search(name or '')
+    return f"EPSG:{match.group(1)}" if match else None
+
+
+def bbox_param(bbox: Bbox, crs: str, swapped: Optional[bool], version: str) -> str:
+    minx, miny, maxx, maxy = get_transformer('EPSG:4326', crs).transform_bounds(*bbox, densify_pts=21)
+    if swapped is None:
+        swapped = version.startswith('2') and pyproj.CRS(crs).axis_info[0].direction in ('north', 'south')
+    srs = f"urn:ogc:def:crs:EPSG::{crs.split(':')[-1]}" if version.startswith('2') else crs
+    values = (miny, minx, maxy, maxx) if swapped else (minx, miny, maxx, maxy)
+    return ','.join(f"{v:.10g}" for v in values) + f",{srs}"
+
+
+async def _plan(service: Dict[str, str], entity_type: str, bbox: Bbox) -> Optional[Dict[str, Any]]:
+    url = service['url']
+    caps = await get_capabilities(url)
+    if not caps:
+        return None
+    if extent_index.due(url):
+        extent_index.store(url, _service_extent(caps))
+
+    layers = settings.BUILDING_LAYER_NAMES if entity_type == 'building' else settings.PARCEL_LAYER_NAMES
+    names = matching_feature_types(caps, layers)
+    known = layer_cache.get(url, entity_type)
+    if known and known['layer'] in caps['feature_types']:
+        names = [known['layer']] + [n for n in names if n != known['layer']]
+    if not names:
+        return None
+
+    layer = names[0]
+    feature_type = caps['feature_types'][layer]
+    if feature_type['bbox'] and not bbox_intersects(feature_type['bbox'], bbox):
+        return None
+
+    versions = caps['versions'] or settings.WFS_VERSIONS
+    version = '2.0.0' if '2.0.0' in versions else versions[0]
+    method = crs_cache.get(url, layer)
+    crs, swapped = method if method else (_epsg(feature_type['crs']) or 'EPSG:2180', None)
+    return {
+        'service': service,
+        'layer': layer,
+        'version': version,
+        'bbox': bbox_param(bbox, crs, swapped, version)
+    }
+
+
+def _registry_services() -> List[Dict[str, str]]:
+    return list({s['url']: s for s in get_registry(settings.WFS_DATA_FILE).all_services()}.values())
+
+
+def _service_extent(caps: Dict[str, Any]) -> Optional[List[float]]:
+    names = matching_feature_types(caps, settings.PARCEL_LAYER_NAMES + settings.BUILDING_LAYER_NAMES)
+    boxes = [caps['feature_types'][n]['bbox'] for n in names if caps['feature_types'][n]['bbox']]
+    if not boxes:
+        return None
+    return [min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)]
+
+
+async def refresh_extents() -> None:
+    due = [s['url'] for s in _registry_services() if extent_index.due(s['url'])]
+    if not due:
+        return
+    sem = asyncio.Semaphore(settings.BBOX_CAPABILITIES_CONCURRENCY)
+
+    async def index(url: str) -> None:
+        async with sem:
+            caps = await get_capabilities(url)
+        if caps:
+            extent_index.store(url, _service_extent(caps))
+        else:
+            extent_index.store_failure(url)
+
+    try:
+        await asyncio.gather(*(index(url) for url in due))
+    finally:
+        await asyncio.get_event_loop().run_in_executor(None, extent_index.save)
+    logger.info("extent index refreshed services=%d", len(due))
+
+
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def schedule_extent_refresh() -> None:
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.ensure_future(refresh_extents())
+
+
+async def stop_extent_refresh() -> None:
+    if _refresh_task is not None and not _refresh_task.done():
+        _refresh_task.cancel()
+        await asyncio.gather(_refresh_task, return_exceptions=True)
+
+
+async def overlapping_services(entity_type: str, bbox: Bbox) -> List[Dict[str, Any]]:
+    services = _registry_services()
+    if any(extent_index.due(s['url']) for s in services):
+        schedule_extent_refresh()
+    candidates = set(extent_index.candidates([s['url'] for s in services], bbox))
+    services = [s for s in services if s['url'] in candidates]
+    sem = asyncio.Semaphore(settings.BBOX_CAPABILITIES_CONCURRENCY)
+
+    async def plan(service: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        async with sem:
+            try:
+                return await _plan(service, entity_type, bbox)
+            except (pyproj.exceptions.CRSError, pyproj.exceptions.ProjError) as e:
+                logger.warning("bbox planning failed url=%s error=%s", service['url'], e)
+                return None
+
+    return [p for p in await asyncio.gather(*(plan(s) for s in services)) if p]
+
+
+async def iter_bbox(entity_type: str, bbox: Bbox) -> AsyncIterator[
+        Tuple[Dict[str, str], Optional[str], Dict[str, Any]]]:
+    plans = await overlapping_services(entity_type, bbox)
+    queue: "asyncio.Queue[Optional[Tuple[Dict[str, str], Optional[str], Dict[str, Any]]]]" = asyncio.Queue(
+        maxsize=settings.STREAM_QUEUE_SIZE)
+
+    async def run(plan: Dict[str, Any]) -> None:
+        service = plan['service']
+        try:
+            async with aclosing(iter_bbox_features(
+                    service['url'], entity_type, plan['layer'], plan['version'], plan['bbox'])) as features:
+                async for entity_id, data in features:
+                    await queue.put((service, entity_id, data))
+        except Exception as e:
+            logger.warning("bbox query failed url=%s layer=%s error=%s", service['url'], plan['layer'], e)
+
+    tasks = [asyncio.create_task(run(p)) for p in plans]
+
+    async def finish() -> None:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await queue.put(None)
+
+    done = asyncio.create_task(finish())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield item
+    finally:
+        for t in tasks:
+            t.cancel()
+        done.cancel()
+        await asyncio.gather(*tasks, done, return_exceptions=True)
@@ -0,0 +1,198 @@
+import asyncio
+import time
+import xml.etree.ElementTree as ET
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import settings
+from utils.metrics import upstream_request_seconds, xml_parse_seconds
+from .http_client import get_client, host_limit
+from .upstream_health import upstream_health
+
+_cache: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
+_pending: Dict[str, asyncio.Task] = {}
+
+
+def _local(tag: str) -> str:
+    return tag.split('}')[-1]
+
+
+def _normalize(name: str) -> str:
+    return name.split(':')[-1].replace('_', '').lower()
+
+
+def _child_text(elem: ET.Element, names: List[str]) -> Optional[str]:
+    for child in elem:
+        if _local(child.tag) in names and child.text:
+            return child.text.strip()
+    return None
+
+
+def _parse_bbox(feature_type: ET.Element) -> Optional[List[float]]:
+    for child in feature_type:
+        name = _local(child.tag)
+        try:
+            if name == 'WGS84BoundingBox':
+                lower = _child_text(child, ['LowerCorner'])
+                upper = _child_text(child, ['UpperCorner'])
+                if lower and upper:
+                    return [float(v) for v in lower.split()[:2] + upper.split()[:2]]
+            elif name == 'LatLongBoundingBox':
+                return [float(child.get(k)) for k in ('minx', 'miny', 'maxx', 'maxy')]
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _is_exception(root: ET.Element) -> bool:
+    return _local(root.tag) in ('ExceptionReport', 'ServiceExceptionReport')
+
+
+def parse_capabilities(xml_text: str) -> Optional[Dict[str, Any]]:
+    root = ET.fromstring(xml_text.encode('utf-8'))
+    if _is_exception(root):
+        return None
+    versions = set()
+    if root.get('version'):
+        versions.add(root.get('version'))
+
+    feature_types = {}
+    for elem in root.iter():
+        name = _local(elem.tag)
+        if name == 'ServiceTypeVersion' and elem.text:
+            versions.add(elem.text.strip())
+        elif name == 'Parameter' and elem.get('name', '').lower() in ('acceptversions', 'version'):
+            for value in elem.iter():
+                if _local(value.tag) == 'Value' and value.text:
+                    versions.add(value.text.strip())
+        elif name == 'FeatureType':
+            type_name = _child_text(elem, ['Name'])
+            if type_name:
+                feature_types[type_name] = {
+                    'crs': _child_text(elem, ['DefaultCRS', 'DefaultSRS', 'SRS']),
+                    'bbox': _parse_bbox(elem)
+                }
+
+    return {
+        'versions': [v for v in settings.WFS_VERSIONS if v in versions],
+        'feature_types': feature_types
+    }
+
+
+def parse_feature_type_attributes(xml_text: str) -> Optional[List[str]]:
+    root = ET.fromstring(xml_text.encode('utf-8'))
+    if _is_exception(root):
+        return None
+    return [e.get('name') for e in root.iter() if _local(e.tag) == 'element' and e.get('name')]
+
+
+async def fetch_text(url: str, params: Dict[str, str]) -> Optional[str]:
+    if not upstream_health.allow(url):
+        return None
+    labels = {'host': urlsplit(url).netloc, 'request': params['REQUEST'], 'version': params.get('VERSION', '')}
+    try:
+        async with host_limit(url):
+            started = time.monotonic()
+            r = await get_client().get(url, params=params, timeout=upstream_health.timeout(url))
+    except httpx.TransportError:
+        upstream_request_seconds.observe(time.monotonic() - started, status='error', **labels)
+        upstream_health.record_failure(url)
+        return None
+    except Exception:
+        return None
+
+    elapsed = time.monotonic() - started
+    upstream_request_seconds.observe(elapsed, status=str(r.status_code), **labels)
+    if r.status_code >= 500:
+        upstream_health.record_failure(url)
+        return None
+    upstream_health.record_success(url, elapsed)
+    if r.status_code != 200:
+        return None
+    return r.text
+
+
+async def _describe(url: str, version: str, type_name: str) -> Optional[List[str]]:
+    key = 'TYPENAMES' if version.startswith('2') else 'TYPENAME'
+    txt = await fetch_text(url, {
+        'SERVICE': 'WFS',
+        'VERSION': version,
+        'REQUEST': 'DescribeFeatureType',
+        key: type_name
+    })
+    if not txt:
+        return None
+    try:
+        with xml_parse_seconds.time(document='DescribeFeatureType'):
+            return parse_feature_type_attributes(txt)
+    except ET.ParseError:
+        return None
+
+
+async def _fetch(url: str) -> Optional[Dict[str, Any]]:
+    txt = await fetch_text(url, {'SERVICE': 'WFS', 'REQUEST': 'GetCapabilities'})
+    if not txt:
+        return None
+    try:
+        with xml_parse_seconds.time(document='GetCapabilities'):
+            return parse_capabilities(txt)
+    except ET.ParseError:
+        return None
+
+
+async def _load(url: str) -> Optional[Dict[str, Any]]:
+    try:
+        caps = await _fetch(url)
+        ttl = settings.CAPABILITIES_TTL if caps else settings.CAPABILITIES_FAILURE_TTL
+        _cache[url] = (time.monotonic() + ttl, caps)
+        return caps
+    finally:
+        _pending.pop(url, None)
+
+
+async def get_capabilities(url: str) -> Optional[Dict[str, Any]]:
+    cached = _cache.get(url)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    task = _pending.get(url)
+    if task is None:
+        task = _pending[url] = asyncio.ensure_future(_load(url))
+    return await asyncio.shield(task)
+
+
+def matching_feature_types(caps: Dict[str, Any], layers: List[str]) -> List[str]:
+    wanted = [_normalize(layer) for layer in layers]
+    return sorted(
+        (name for name in caps['feature_types'] if _normalize(name) in wanted),
+        key=lambda name: wanted.index(_normalize(name))
+    )
+
+
+async def plausible_candidates(url: str, layers: List[str], fields: List[str]) -> Optional[List[Tuple[str, str, str]]]:
+    caps = await get_capabilities(url)
+    if not caps or not caps['feature_types']:
+        return None
+
+    matched = matching_feature_types(caps, layers)
+    if not matched:
+        return None
+
+    versions = caps['versions'] or settings.WFS_VERSIONS
+    attributes = caps.setdefault('attributes', {})
+    missing = [name for name in matched if name not in attributes]
+    if missing:
+        described = await asyncio.gather(*(_describe(url, versions[0], name) for name in missing))
+        attributes.update(zip(missing, described))
+
+    wanted_fields = {_normalize(f) for f in fields}
+    candidates = []
+    for name in matched:
+        attrs = attributes.get(name)
+        layer_fields = [a for a in attrs if _normalize(a) in wanted_fields] if attrs else []
+        for f in layer_fields or fields:
+            for v in versions:
+                candidates.append((name, v, f))
+    return candidates
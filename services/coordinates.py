@@ -0,0 +1,74 @@
+import xml.etree.ElementTree as ET
+from typing import Optional
+
+import numpy as np
+
+
+def _floats(text: str) -> np.ndarray:
+    tokens = text.split()
+    try:
+        return np.array(tokens, dtype=np.float64)
+    except ValueError:
+        values = []
+        for token in tokens:
+            try:
+                values.append(float(token))
+            except ValueError:
+                values.append(np.nan)
+        return np.array(values, dtype=np.float64)
+
+
+def _to_xy(values: np.ndarray, dimension: int) -> np.ndarray:
+    dimension = max(dimension, 2)
+    count = len(values) // dimension
+    xy = values[:count * dimension].reshape(count, dimension)[:, :2]
+    return np.ascontiguousarray(xy[~np.isnan(xy).any(axis=1)])
+
+
+def decode_pos_list(text: str, dimension: int = 2) -> np.ndarray:
+    if ',' in text:
+        return decode_coordinates(text)
+    return _to_xy(_floats(text), dimension)
+
+
+def decode_coordinates(text: str, cs: str = ',', ts: str = ' ', decimal: str = '.') -> np.ndarray:
+    text = text.strip()
+    if not text:
+        return np.empty((0, 2), dtype=np.float64)
+
+    tuples = text.split() if ts.isspace() else text.split(ts)
+    dimension = tuples[0].strip().count(cs) + 1 if cs != ts else 2
+
+    flat = text
+    for separator in (cs, ts):
+        if separator != ' ':
+            flat = flat.replace(separator, ' ')
+    if decimal != '.':
+        flat = flat.replace(decimal, '.')
+
+    values = _floats(flat)
+    if len(values) % dimension:
+        rows = [_floats(t.replace(cs, ' ').replace(decimal, '.')) for t in tuples]
+        rows = [r[:2] for r in rows if len(r) >= 2 and not np.isnan(r[:2]).any()]
+        if not rows:
+            return np.empty((0, 2), dtype=np.float64)
+        return np.array(rows, dtype=np.float64)
+    return _to_xy(values, dimension)
+
+
+def decode_coordinate_element(elem: ET.Element, dimension: int = 2) -> Optional[np.ndarray]:
+    if not elem.text or not elem.text.strip():
+        return None
+
+    name = elem.tag.split('}')[-1]
+    if name in ('posList', 'pos'):
+        dimension = int(elem.get('srsDimension') or elem.get('dimension') or dimension)
+        return decode_pos_list(elem.text, dimension)
+    if name == 'coordinates':
+        return decode_coordinates(
+            elem.text,
+            elem.get('cs', ','),
+            elem.get('ts', ' '),
+            elem.get('decimal', '.')
+        )
+    return None
@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+from typing import Optional, Dict, Tuple, Any
+
+from config import settings
+from utils import get_registry
+from utils.metrics import cache_requests_total
+
+
+class CrsCache:
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url: str, layer: str) -> str:
+        return f"{url}|{layer}"
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def override(url: str) -> Optional[Tuple[str, bool]]:
+        for service in get_registry(settings.WFS_DATA_FILE).services_for_url(url):
+            if service.get('crs'):
+                return service['crs'], service.get('axis') == 'yx'
+        return None
+
+    def get(self, url: str, layer: str) -> Optional[Tuple[str, bool]]:
+        forced = self.override(url)
+        if forced:
+            cache_requests_total.inc(cache='crs', result='override')
+            return forced
+        with self._lock:
+            entry = self._load().get(self._key(url, layer))
+        if entry is None:
+            cache_requests_total.inc(cache='crs', result='miss')
+            return None
+        cache_requests_total.inc(cache='crs', result='hit')
+        return entry['crs'], entry['swapped']
+
+    def store(self, url: str, layer: str, crs: str, swapped: bool) -> None:
+        if self.override(url):
+            return
+        key = self._key(url, layer)
+        entry = {'crs': crs, 'swapped': swapped}
+        with self._lock:
+            entries = self._load()
+            if entries.get(key) == entry:
+                return
+            entries[key] = entry
+            self._save()
+
+    def invalidate(self, url: str, layer: str) -> None:
+        with self._lock:
+            if self._load().pop(self._key(url, layer), None) is not None:
+                self._save()
+
+
+crs_cache = CrsCache(settings.CRS_CACHE_FILE)
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Any, Tuple
+
+from config import settings
+from utils.metrics import cache_requests_total
+
+Export = Tuple[bytes, str, str]
+EtagKey = Tuple[str, str, str, str, str]
+
+
+def export_digest(data: Any, entity_id: str, entity_type: str, format_type: str) -> str:
+    payload = json.dumps([data, entity_id, entity_type, format_type.lower()], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or etag in (t[2:] if t.startswith('W/') else t for t in tags)
+
+
+class ExportCache:
+    def __init__(self, max_bytes: int, max_etags: int, etag_ttl: float):
+        self.max_bytes = max_bytes
+        self.max_etags = max_etags
+        self.etag_ttl = etag_ttl
+        self._entries: "OrderedDict[str, Export]" = OrderedDict()
+        self._size = 0
+        self._etags: "OrderedDict[EtagKey, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[Export]:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+        cache_requests_total.inc(cache='export', result='hit' if entry else 'miss')
+        return entry
+
+    def put(self, digest: str, export: Export) -> None:
+        size = len(export[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[digest] = export
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[0])
+
+    def etag_for(self, url: str, entity_type: str, entity_id: str, format_type: str,
+                 variant: str = '') -> Optional[str]:
+        key = (url, entity_type, entity_id, format_type.lower(), variant)
+        with self._lock:
+            entry = self._etags.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self.etag_ttl:
+                self._etags.pop(key, None)
+                return None
+            return entry[1]
+
+    def remember_etag(self, url: str, entity_type: str, entity_id: str, format_type: str, etag: str,
+                      variant: str = '') -> None:
+        key = (url, entity_type, entity_id, format_type.lower(), variant)
+        with self._lock:
+            self._etags[key] = (time.time(), etag)
+            self._etags.move_to_end(key)
+            while len(self._etags) > self.max_etags:
+                self._etags.popitem(last=False)
+
+
+export_cache = ExportCache(
+    settings.EXPORT_CACHE_MAX_BYTES,
+    settings.LOOKUP_CACHE_MAX_ENTRIES,
+    settings.LOOKUP_CACHE_TTL
+)
@@ -1,119 +1,211 @@
 import asyncio
 import io
+import json
 import os
 import tempfile
-from pathlib import Path
-from typing import Dict, Any
-
-import geopandas as gpd
-import pandas as pd
+import time
+from contextlib import aclosing
+from typing import Dict, Any, List, Tuple, Optional, AsyncIterator
+
+import numpy as np
+import orjson
+import shapely
+from pyogrio.raw import write as ogr_write
 from shapely.geometry import shape
 
+from utils.metrics import export_seconds
+from .export_cache import export_cache, export_digest
+from .geometry_service import round_geometry
 
-async def create_geodataframe(data: Dict[str, Any], entity_id: str, entity_type: str) -> gpd.GeoDataFrame:
-    def _create_gdf():
-        attributes = data['attributes'].copy()
-        attributes['entity_id'] = entity_id
-        attributes['entity_type'] = entity_type
-        attributes['author'] = 'ernestilchenko'
+Feature = Tuple[Dict[str, Any], Optional[Dict[str, Any]]]
 
-        geometry = None
-        if data['geometry']:
-            geometry = shape(data['geometry'])
 
-        df_data = {k: [v] for k, v in attributes.items()}
-        df = pd.DataFrame(df_data)
+def build_feature(data: Dict[str, Any], entity_id: str, entity_type: str) -> Feature:
+    properties = data['attributes'].copy()
+    properties['entity_id'] = entity_id
+    properties['entity_type'] = entity_type
+    properties['author'] = 'ernestilchenko'
+    return properties, data['geometry']
 
-        if geometry:
-            gdf = gpd.GeoDataFrame(df, geometry=[geometry], crs='EPSG:4326')
-        else:
-            gdf = gpd.GeoDataFrame(df)
 
-        return gdf
+def export_to_geojson(features: List[Feature]) -> bytes:
+    collection = {
+        'type': 'FeatureCollection',
+        'features': [
+            {'id': str(i), 'type': 'Feature', 'properties': properties, 'geometry': geometry}
+            for i, (properties, geometry) in enumerate(features)
+        ]
+    }
+    return orjson.dumps(collection)
 
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _create_gdf)
 
+def _geometry_type(features: List[Feature]) -> str:
+    types = {geometry['type'] for _, geometry in features if geometry}
+    return types.pop() if len(types) == 1 else 'Unknown'
 
-async def export_to_geojson(gdf: gpd.GeoDataFrame) -> str:
-    def _export():
-        return gdf.to_json()
 
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _export)
+def _columns(features: List[Feature]) -> Tuple[List[str], List[np.ndarray], np.ndarray]:
+    names = list(dict.fromkeys(k for properties, _ in features for k in properties))
+    field_data = [
+        np.array([None if properties.get(n) is None else str(properties[n]) for properties, _ in features],
+                 dtype=object)
+        for n in names
+    ]
+    geometry = np.array(
+        [shapely.to_wkb(shape(g)) if g else None for _, g in features],
+        dtype=object
+    )
+    return names, field_data, geometry
 
 
-async def export_to_gml(gdf: gpd.GeoDataFrame) -> bytes:
-    def _export():
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_file = os.path.join(temp_dir, "export.gml")
-            gdf.to_file(temp_file, driver="GML")
-            with open(temp_file, 'rb') as f:
-                return f.read()
+def _ogr_write(target: Any, features: List[Feature], driver: str) -> None:
+    names, field_data, geometry = _columns(features)
+    ogr_write(
+        target, geometry, field_data, names,
+        driver=driver, layer='export', crs='EPSG:4326', geometry_type=_geometry_type(features)
+    )
 
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _export)
 
+def _write_ogr(features: List[Feature], driver: str) -> bytes:
+    buffer = io.BytesIO()
+    _ogr_write(buffer, features, driver)
+    return buffer.getvalue()
 
-async def export_to_kml(gdf: gpd.GeoDataFrame) -> bytes:
-    def _export():
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_file = os.path.join(temp_dir, "export.kml")
-            gdf.to_file(temp_file, driver="KML")
-            with open(temp_file, 'rb') as f:
-                return f.read()
 
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _export)
+def export_to_gml(features: List[Feature]) -> bytes:
+    return _write_ogr(features, 'GML')
 
 
-async def export_to_shapefile(gdf: gpd.GeoDataFrame) -> bytes:
-    def _export():
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_file = os.path.join(temp_dir, "export.shp")
-            gdf.to_file(temp_file)
+def export_to_kml(features: List[Feature]) -> bytes:
+    return _write_ogr(features, 'KML')
 
-            buffer = io.BytesIO()
-            import zipfile
 
-            with zipfile.ZipFile(buffer, 'w') as zf:
-                base_name = Path(temp_file).stem
-                extensions = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+def export_to_geopackage(features: List[Feature]) -> bytes:
+    return _write_ogr(features, 'GPKG')
 
-                for ext in extensions:
-                    file_path = os.path.join(temp_dir, f"{base_name}{ext}")
-                    if os.path.exists(file_path):
-                        zf.write(file_path, f"{base_name}{ext}")
 
-            buffer.seek(0)
-            return buffer.read()
+def export_to_flatgeobuf(features: List[Feature]) -> bytes:
+    return _write_ogr(features, 'FlatGeobuf')
 
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _export)
 
+def export_to_geoparquet(features: List[Feature]) -> bytes:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    names, field_data, geometry = _columns(features)
+    geometries = [shape(g) for _, g in features if g]
+    column = {
+        'encoding': 'WKB',
+        'geometry_types': sorted({g.geom_type for g in geometries})
+    }
+    if geometries:
+        column['bbox'] = list(shapely.total_bounds(geometries))
+
+    table = pa.table(
+        [pa.array(values, pa.string()) for values in field_data] + [pa.array(geometry, pa.binary())],
+        names=names + ['geometry']
+    )
+    table = table.replace_schema_metadata({
+        b'geo': json.dumps({'version': '1.1.0', 'primary_column': 'geometry', 'columns': {'geometry': column}})
+    })
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression='zstd')
+    return buffer.getvalue()
+
+
+def export_to_shapefile(features: List[Feature]) -> bytes:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'export.shp.zip')
+        _ogr_write(path, features, 'ESRI Shapefile')
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+EXPORT_FORMATS = {
+    'geojson': (export_to_geojson, "application/geo+json", "{name}_by_ernestilchenko.geojson"),
+    'gml': (export_to_gml, "application/gml+xml", "{name}_by_ernestilchenko.gml"),
+    'kml': (export_to_kml, "application/vnd.google-earth.kml+xml", "{name}_by_ernestilchenko.kml"),
+    'shp': (export_to_shapefile, "application/zip", "{name}_shapefile_by_ernestilchenko.zip"),
+    'gpkg': (export_to_geopackage, "application/geopackage+sqlite3", "{name}_by_ernestilchenko.gpkg"),
+    'fgb': (export_to_flatgeobuf, "application/flatgeobuf", "{name}_by_ernestilchenko.fgb"),
+    'parquet': (export_to_geoparquet, "application/vnd.apache.parquet", "{name}_by_ernestilchenko.parquet")
+}
 
-async def get_export_data(data: Dict[str, Any], entity_id: str, entity_type: str, format_type: str) -> tuple[
-    bytes, str, str]:
-    gdf = await create_geodataframe(data, entity_id, entity_type)
 
+async def _render(features: List[Feature], digest: str, name: str, format_type: str) -> tuple[bytes, str, str, str]:
+    etag = f'"{digest}"'
+    cached = export_cache.get(digest)
+    if cached:
+        return (*cached, etag)
+
+    if format_type.lower() not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported format: {format_type}")
+    export, media_type, filename = EXPORT_FORMATS[format_type.lower()]
+
+    started = time.perf_counter()
     if format_type.lower() == 'geojson':
-        content_str = await export_to_geojson(gdf)
-        content = content_str.encode('utf-8')
-        media_type = "application/geo+json"
-        filename = f"{entity_id}_by_ernestilchenko.geojson"
-    elif format_type.lower() == 'gml':
-        content = await export_to_gml(gdf)
-        media_type = "application/gml+xml"
-        filename = f"{entity_id}_by_ernestilchenko.gml"
-    elif format_type.lower() == 'kml':
-        content = await export_to_kml(gdf)
-        media_type = "application/vnd.google-earth.kml+xml"
-        filename = f"{entity_id}_by_ernestilchenko.kml"
-    elif format_type.lower() == 'shp':
-        content = await export_to_shapefile(gdf)
-        media_type = "application/zip"
-        filename = f"{entity_id}_shapefile_by_ernestilchenko.zip"
+        content = export(features)
     else:
-        raise ValueError(f"Unsupported format: {format_type}")
+        content = await asyncio.get_event_loop().run_in_executor(None, export, features)
+    export_seconds.observe(time.perf_counter() - started, format=format_type.lower())
 
-    return content, media_type, filename
+    filename = filename.format(name=name)
+    export_cache.put(digest, (content, media_type, filename))
+    return content, media_type, filename, etag
+
+
+async def get_export_data(data: Dict[str, Any], entity_id: str, entity_type: str, format_type: str) -> tuple[
+    bytes, str, str, str]:
+    digest = export_digest(data, entity_id, entity_type, format_type)
+    return await _render([build_feature(data, entity_id, entity_type)], digest, entity_id, format_type)
+
+
+async def get_batch_export_data(items: List[Dict[str, Any]], entity_type: str, format_type: str) -> tuple[
+    bytes, str, str, str]:
+    found = [item for item in items if item['data']]
+    digest = export_digest([[item['id'], item['data']] for item in found], f"{entity_type}s", entity_type, format_type)
+    features = [build_feature(item['data'], item['id'], entity_type) for item in found]
+    return await _render(features, digest, f"{entity_type}s", format_type)
+
+
+STREAM_FORMATS = {
+    'geojsonseq': (b'\x1e', "application/geo+json-seq", "{name}_by_ernestilchenko.geojsons"),
+    'ndjson': (b'', "application/x-ndjson", "{name}_by_ernestilchenko.ndjson")
+}
+
+
+def stream_export_headers(entity_type: str, format_type: str) -> Tuple[str, str]:
+    _, media_type, filename = STREAM_FORMATS[format_type.lower()]
+    return media_type, filename.format(name=f"{entity_type}s")
+
+
+async def stream_export(items: AsyncIterator[Dict[str, Any]], entity_type: str, format_type: str) -> AsyncIterator[
+        bytes]:
+    prefix = STREAM_FORMATS[format_type.lower()][0]
+    started = time.perf_counter()
+    try:
+        async with aclosing(items) as results:
+            async for item in results:
+                if item['data']:
+                    properties, geometry = build_feature(item['data'], item['id'], entity_type)
+                else:
+                    properties = {'entity_id': item['id'], 'entity_type': entity_type, 'error': item['error']}
+                    geometry = None
+                feature = {'type': 'Feature', 'id': item['id'], 'properties': properties, 'geometry': geometry}
+                yield prefix + orjson.dumps(feature) + b'\n'
+    finally:
+        export_seconds.observe(time.perf_counter() - started, format=format_type.lower())
+
+
+async def stream_feature_collection(features: AsyncIterator[Tuple[Dict[str, str], Optional[str], Dict[str, Any]]],
+                                    entity_type: str, precision: Optional[int] = None) -> AsyncIterator[bytes]:
+    yield b'{"type":"FeatureCollection","features":['
+    separator = b''
+    async with aclosing(features) as results:
+        async for service, entity_id, data in results:
+            properties = {**data['attributes'], 'entity_type': entity_type, 'teryt': service['teryt']}
+            geometry = round_geometry(data['geometry'], precision)
+            feature = {'type': 'Feature', 'id': entity_id, 'properties': properties, 'geometry': geometry}
+            yield separator + orjson.dumps(feature)
+            separator = b','
+    yield b']}'
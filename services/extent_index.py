@@ -0,0 +1,75 @@
+import json
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+from config import settings
+
+Bbox = Tuple[float, float, float, float]
+
+
+def bbox_intersects(a: List[float], b: Bbox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class ExtentIndex:
+    def __init__(self, path: str, ttl: float, failure_ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def save(self) -> None:
+        with self._lock:
+            entries = dict(self._load())
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def due(self, url: str) -> bool:
+        with self._lock:
+            entry = self._load().get(url)
+        if entry is None:
+            return True
+        ttl = self.ttl if entry['indexed'] else self.failure_ttl
+        return time.time() - entry['checked_at'] >= ttl
+
+    def store(self, url: str, bbox: Optional[List[float]]) -> None:
+        with self._lock:
+            self._load()[url] = {'indexed': True, 'bbox': bbox, 'checked_at': time.time()}
+
+    def store_failure(self, url: str) -> None:
+        with self._lock:
+            entries = self._load()
+            previous = entries.get(url)
+            if previous and previous['indexed']:
+                previous['checked_at'] = time.time() - self.ttl + self.failure_ttl
+            else:
+                entries[url] = {'indexed': False, 'bbox': None, 'checked_at': time.time()}
+
+    def candidates(self, urls: List[str], bbox: Bbox) -> List[str]:
+        with self._lock:
+            entries = self._load()
+            return [
+                url for url in urls
+                if url not in entries or entries[url]['indexed']
+                and (entries[url]['bbox'] is None or bbox_intersects(entries[url]['bbox'], bbox))
+            ]
+
+
+extent_index = ExtentIndex(settings.EXTENT_INDEX_FILE, settings.CAPABILITIES_TTL, settings.CAPABILITIES_FAILURE_TTL)
@@ -1,13 +1,50 @@
+import logging
+import math
+import threading
+import time
 import xml.etree.ElementTree as ET
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple, List
 
+import numpy as np
+import orjson
 import pyproj
+import shapely
+from shapely.geometry import shape
 
+from config import settings
+from utils.metrics import crs_transform_seconds
+from .coordinates import decode_coordinate_element
 
-def detect_crs_from_gml(geometry_xml: str) -> str:
-    try:
-        root = ET.fromstring(geometry_xml)
+POLISH_CRS = ['EPSG:2180', 'EPSG:2177', 'EPSG:2176', 'EPSG:2178', 'EPSG:2179']
+WORLD_BOUNDS = (-180, -90, 180, 90)
+REGION_BOUNDS = (10, 45, 30, 60)
+POLAND_BOUNDS = (13.5, 48.5, 24.5, 55.2)
+
+logger = logging.getLogger(__name__)
+
+_transformers: Dict[Tuple[str, str, bool], pyproj.Transformer] = {}
+_transformers_lock = threading.Lock()
+
+
+def get_transformer(source_crs: str, target_crs: str = 'EPSG:4326', always_xy: bool = True) -> pyproj.Transformer:
+    key = (source_crs, target_crs, always_xy)
+    transformer = _transformers.get(key)
+    if transformer is None:
+        with _transformers_lock:
+            transformer = _transformers.get(key)
+            if transformer is None:
+                transformer = pyproj.Transformer.from_crs(source_crs, target_crs, always_xy=always_xy)
+                _transformers[key] = transformer
+    return transformer
 
+
+def prewarm_transformers() -> None:
+    for crs in settings.PREWARM_CRS:
+        get_transformer(crs)
+
+
+def detect_crs_from_element(root: ET.Element) -> str:
+    try:
         for elem in root.iter():
             srs_name = elem.get('srsName')
             if srs_name:
@@ -51,113 +88,237 @@ def detect_crs_from_gml(geometry_xml: str) -> str:
     return 'EPSG:2180'
 
 
-def transform_coordinates_to_wgs84(coords_list: list, source_crs: str) -> list:
-    if source_crs == 'EPSG:4326' or not coords_list:
-        return coords_list
+def detect_crs_from_gml(geometry_xml: str) -> str:
+    try:
+        return detect_crs_from_element(ET.fromstring(geometry_xml))
+    except ET.ParseError:
+        return 'EPSG:2180'
+
+
+def _within(lon: np.ndarray, lat: np.ndarray, bounds: Tuple[float, float, float, float]) -> np.ndarray:
+    min_lon, min_lat, max_lon, max_lat = bounds
+    return (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
 
-    print(f"Transforming {len(coords_list)} coordinates from {source_crs} to WGS84")
-    print(f"Sample input coordinates: {coords_list[:2] if coords_list else 'None'}")
 
-    try:
-        transformer = pyproj.Transformer.from_crs(source_crs, 'EPSG:4326', always_xy=True)
-        transformed_coords = []
+def _transform_array(coords: np.ndarray, crs: str, swapped: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    transformer = get_transformer(crs)
+    if swapped:
+        return transformer.transform(coords[:, 1], coords[:, 0])
+    return transformer.transform(coords[:, 0], coords[:, 1])
 
-        for i, coord in enumerate(coords_list):
-            if len(coord) >= 2:
-                x, y = coord[0], coord[1]
-                try:
-                    lon, lat = transformer.transform(x, y)
-
-                    if -180 <= lon <= 180 and -90 <= lat <= 90:
-                        if 10 <= lon <= 30 and 45 <= lat <= 60:
-                            transformed_coords.append([lon, lat])
-                            if i < 2:
-                                print(f"  [{x}, {y}] -> [{lon:.6f}, {lat:.6f}]")
-                        else:
-                            print(f"Coordinates outside Eastern Europe, trying swapped order")
-                            return transform_swapped_coordinates(coords_list, source_crs)
-                    else:
-                        print(f"Invalid coordinates, trying different CRS")
-                        return try_different_crs(coords_list)
-                except Exception as e:
-                    print(f"Transform error: {e}")
-                    return try_different_crs(coords_list)
-            else:
-                transformed_coords.append(coord)
-
-        if transformed_coords:
-            print(f"Successfully transformed to: {transformed_coords[:2] if transformed_coords else 'None'}")
-            return transformed_coords
-        else:
-            return try_different_crs(coords_list)
 
-    except Exception as e:
-        print(f"Transformation failed: {e}")
-        return try_different_crs(coords_list)
+def _transform_detect(coords: np.ndarray, source_crs: str, fallback: bool = True) -> Tuple[
+        np.ndarray, Optional[Tuple[str, bool]]]:
+    coords = np.asarray(coords, dtype=np.float64)
+    if source_crs == 'EPSG:4326' or not len(coords):
+        return coords, (source_crs, False)
 
+    logger.debug("transforming coordinates count=%d source_crs=%s", len(coords), source_crs)
 
-def transform_swapped_coordinates(coords_list: list, source_crs: str) -> list:
     try:
-        transformer = pyproj.Transformer.from_crs(source_crs, 'EPSG:4326', always_xy=True)
-        transformed_coords = []
+        lon, lat = _transform_array(coords, source_crs)
+    except Exception as e:
+        logger.warning("transformation failed source_crs=%s error=%s", source_crs, e)
+        return _try_different_crs(coords) if fallback else (coords, None)
 
-        for coord in coords_list:
-            if len(coord) >= 2:
-                y, x = coord[0], coord[1]  # Swapped order
-                try:
-                    lon, lat = transformer.transform(x, y)
-
-                    if -180 <= lon <= 180 and -90 <= lat <= 90:
-                        if 10 <= lon <= 30 and 45 <= lat <= 60:
-                            transformed_coords.append([lon, lat])
-                        else:
-                            return coords_list
-                    else:
-                        return coords_list
-                except Exception:
-                    return coords_list
-            else:
-                transformed_coords.append(coord)
-
-        if transformed_coords:
-            print(f"Successfully transformed with swapped coordinates")
-            return transformed_coords
-        else:
-            return coords_list
+    valid = _within(lon, lat, WORLD_BOUNDS)
+    in_region = valid & _within(lon, lat, REGION_BOUNDS)
+    if in_region.all():
+        return np.column_stack((lon, lat)), (source_crs, False)
+
+    if valid[np.argmin(in_region)]:
+        logger.debug("coordinates outside region, trying swapped axes source_crs=%s", source_crs)
+        return _transform_swapped(coords, source_crs)
 
+    logger.debug("invalid coordinates, trying other Polish CRS source_crs=%s", source_crs)
+    return _try_different_crs(coords) if fallback else (coords, None)
+
+
+def _transform_swapped(coords: np.ndarray, source_crs: str) -> Tuple[np.ndarray, Optional[Tuple[str, bool]]]:
+    try:
+        lon, lat = _transform_array(coords, source_crs, swapped=True)
     except Exception:
-        return coords_list
+        return coords, None
 
+    if not len(coords) or not (_within(lon, lat, WORLD_BOUNDS) & _within(lon, lat, REGION_BOUNDS)).all():
+        return coords, None
 
-def try_different_crs(coords_list: list) -> list:
-    polish_systems = ['EPSG:2180', 'EPSG:2177', 'EPSG:2176', 'EPSG:2178', 'EPSG:2179']
+    logger.debug("transformed with swapped axes source_crs=%s", source_crs)
+    return np.column_stack((lon, lat)), (source_crs, True)
 
-    for crs in polish_systems:
+
+def _try_different_crs(coords: np.ndarray) -> Tuple[np.ndarray, Optional[Tuple[str, bool]]]:
+    for crs in POLISH_CRS:
         try:
-            transformer = pyproj.Transformer.from_crs(crs, 'EPSG:4326', always_xy=True)
+            transformer = get_transformer(crs)
+            x, y = coords[0, 0], coords[0, 1]
+
+            lon, lat = transformer.transform(x, y)
+            if 14 <= lon <= 24 and 49 <= lat <= 54:
+                logger.debug("matched fallback crs=%s swapped=false", crs)
+                return _transform_detect(coords, crs, fallback=False)
 
-            if coords_list:
-                test_coord = coords_list[0]
-                if len(test_coord) >= 2:
-                    x, y = test_coord[0], test_coord[1]
-                    lon, lat = transformer.transform(x, y)
+            lon, lat = transformer.transform(y, x)
+            if 14 <= lon <= 24 and 49 <= lat <= 54:
+                logger.debug("matched fallback crs=%s swapped=true", crs)
+                return _transform_swapped(coords, crs)
 
-                    if 14 <= lon <= 24 and 49 <= lat <= 54:
-                        print(f"Found correct CRS: {crs}")
-                        return transform_coordinates_to_wgs84(coords_list, crs)
+        except Exception:
+            continue
 
-                    y, x = test_coord[0], test_coord[1]  # Try swapped
-                    lon, lat = transformer.transform(x, y)
+    logger.warning("no suitable transformation found, returning original coordinates count=%d", len(coords))
+    return coords, None
 
-                    if 14 <= lon <= 24 and 49 <= lat <= 54:
-                        print(f"Found correct CRS with swapped coordinates: {crs}")
-                        return transform_swapped_coordinates(coords_list, crs)
 
+def _transform_known(coords: np.ndarray, crs: str, swapped: bool) -> Optional[np.ndarray]:
+    if crs == 'EPSG:4326':
+        lon, lat = (coords[:, 1], coords[:, 0]) if swapped else (coords[:, 0], coords[:, 1])
+    else:
+        try:
+            lon, lat = _transform_array(coords, crs, swapped)
         except Exception:
-            continue
+            return None
+    if not _within(lon, lat, POLAND_BOUNDS).all():
+        return None
+    return np.column_stack((lon, lat))
+
+
+def transform_coordinates_to_wgs84(coords: np.ndarray, source_crs: str) -> np.ndarray:
+    return _transform_detect(coords, source_crs)[0]
+
+
+def _split(coords: np.ndarray, sizes: List[int]) -> List[np.ndarray]:
+    return np.split(coords, np.cumsum(sizes)[:-1])
+
+
+def _concat(rings: List[np.ndarray]) -> np.ndarray:
+    return np.concatenate(rings) if len(rings) > 1 else np.asarray(rings[0], dtype=np.float64)
 
-    print("Could not find suitable transformation, returning original coordinates")
-    return coords_list
+
+def transform_rings_known(rings: List[np.ndarray], crs: str, swapped: bool) -> Optional[List[np.ndarray]]:
+    if not rings:
+        return rings
+    transformed = _transform_known(_concat(rings), crs, swapped)
+    if transformed is None:
+        return None
+    return _split(transformed, [len(r) for r in rings])
+
+
+def transform_rings_to_wgs84(rings: List[np.ndarray], source_crs: str) -> Tuple[
+        List[np.ndarray], Optional[Tuple[str, bool]]]:
+    if not rings:
+        return rings, None
+    transformed, method = _transform_detect(_concat(rings), source_crs)
+    if method and not _within(transformed[:, 0], transformed[:, 1], POLAND_BOUNDS).all():
+        method = None
+    return _split(transformed, [len(r) for r in rings]), method
+
+
+def _local(tag: str) -> str:
+    return tag.split('}')[-1]
+
+
+def _line_coords(elem: ET.Element, dimension: int) -> Optional[np.ndarray]:
+    parts = []
+    for e in elem.iter():
+        if _local(e.tag) in ('posList', 'coordinates'):
+            coords = decode_coordinate_element(e, dimension)
+            if coords is not None and len(coords):
+                if parts and np.array_equal(parts[-1][-1], coords[0]):
+                    coords = coords[1:]
+                parts.append(coords)
+    if not parts:
+        parts = [c for c in (decode_coordinate_element(e, dimension) for e in elem.iter() if _local(e.tag) == 'pos')
+                 if c is not None and len(c)]
+    if not parts:
+        return None
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+
+def _polygon_rings(elem: ET.Element, dimension: int) -> List[np.ndarray]:
+    exterior = None
+    interiors = []
+    for child in elem:
+        name = _local(child.tag)
+        if name in ('exterior', 'outerBoundaryIs'):
+            exterior = _line_coords(child, dimension)
+        elif name in ('interior', 'innerBoundaryIs'):
+            ring = _line_coords(child, dimension)
+            if ring is not None:
+                interiors.append(ring)
+    if exterior is None:
+        return []
+    return [exterior] + interiors
+
+
+def _collect_parts(elem: ET.Element, dimension: int, parts: Dict[str, list]) -> None:
+    dimension = int(elem.get('srsDimension') or dimension)
+    name = _local(elem.tag)
+    if name in ('Polygon', 'PolygonPatch', 'Triangle', 'Rectangle'):
+        rings = _polygon_rings(elem, dimension)
+        if rings:
+            parts['polygons'].append(rings)
+        return
+    if name in ('LineString', 'Curve', 'LinearRing', 'Ring'):
+        coords = _line_coords(elem, dimension)
+        if coords is not None:
+            parts['lines'].append(coords)
+        return
+    if name == 'Point':
+        coords = _line_coords(elem, dimension)
+        if coords is not None:
+            parts['points'].append(coords[:1])
+        return
+    if name in ('Envelope', 'boundedBy'):
+        return
+    for child in elem:
+        _collect_parts(child, dimension, parts)
+
+
+def geometry_element_to_geojson(elem: ET.Element, known: Optional[Tuple[str, bool]] = None) -> Tuple[
+        Optional[Tuple[str, bool]], Optional[Dict[str, Any]]]:
+    def transform(rings: List[np.ndarray]) -> Tuple[List[np.ndarray], Optional[Tuple[str, bool]]]:
+        started = time.perf_counter()
+        if known:
+            transformed = transform_rings_known(rings, *known)
+            if transformed is not None:
+                crs_transform_seconds.observe(time.perf_counter() - started, method='known')
+                return transformed, known
+        source_crs = detect_crs_from_element(elem)
+        logger.debug("detected crs=%s", source_crs)
+        result = transform_rings_to_wgs84(rings, source_crs)
+        crs_transform_seconds.observe(time.perf_counter() - started, method='detected')
+        return result
+
+    try:
+        parts = {'polygons': [], 'lines': [], 'points': []}
+        _collect_parts(elem, 2, parts)
+
+        if parts['polygons']:
+            polygons = parts['polygons']
+            flat, method = transform([ring for rings in polygons for ring in rings])
+            transformed = []
+            for rings in polygons:
+                transformed.append([r.tolist() for r in flat[:len(rings)]])
+                flat = flat[len(rings):]
+            if len(transformed) == 1:
+                return method, {"type": "Polygon", "coordinates": transformed[0]}
+            return method, {"type": "MultiPolygon", "coordinates": transformed}
+
+        for key, single, multi in (('lines', 'LineString', 'MultiLineString'), ('points', 'Point', 'MultiPoint')):
+            if not parts[key]:
+                continue
+            transformed, method = transform(parts[key])
+            if key == 'points':
+                transformed = [p[0] for p in transformed]
+            if len(transformed) == 1:
+                return method, {"type": single, "coordinates": transformed[0].tolist()}
+            return method, {"type": multi, "coordinates": [t.tolist() for t in transformed]}
+
+    except Exception as e:
+        logger.warning("error parsing geometry error=%s", e)
+
+    return None, None
 
 
 def parse_gml_geometry_to_geojson(geometry_xml: str) -> Optional[Dict[str, Any]]:
@@ -166,106 +327,59 @@ def parse_gml_geometry_to_geojson(geometry_xml: str) -> Optional[Dict[str, Any]]
 
     try:
         root = ET.fromstring(geometry_xml)
-        source_crs = detect_crs_from_gml(geometry_xml)
-        print(f"Detected CRS: {source_crs}")
-
-        def extract_coordinates(coord_text: str) -> list:
-            coords = []
-            coord_text = coord_text.strip()
-
-            if ',' in coord_text:
-                coord_pairs = coord_text.split()
-                for pair in coord_pairs:
-                    if ',' in pair:
-                        parts = pair.split(',')
-                        if len(parts) >= 2:
-                            try:
-                                x = float(parts[0])
-                                y = float(parts[1])
-                                coords.append([x, y])
-                            except ValueError:
-                                continue
-            else:
-                coord_pairs = coord_text.split()
-                for i in range(0, len(coord_pairs), 2):
-                    if i + 1 < len(coord_pairs):
-                        try:
-                            x = float(coord_pairs[i])
-                            y = float(coord_pairs[i + 1])
-                            coords.append([x, y])
-                        except ValueError:
-                            continue
-            return coords
-
-        for child in root.iter():
-            if 'Polygon' in child.tag:
-                exterior_coords = []
-                interior_coords = []
-
-                for subchild in child.iter():
-                    if 'exterior' in subchild.tag or 'outerBoundaryIs' in subchild.tag:
-                        for coord_elem in subchild.iter():
-                            if coord_elem.text and any(
-                                    keyword in coord_elem.tag for keyword in ['coordinates', 'posList']):
-                                exterior_coords = extract_coordinates(coord_elem.text)
-                    elif 'interior' in subchild.tag or 'innerBoundaryIs' in subchild.tag:
-                        for coord_elem in subchild.iter():
-                            if coord_elem.text and any(
-                                    keyword in coord_elem.tag for keyword in ['coordinates', 'posList']):
-                                interior_coords.append(extract_coordinates(coord_elem.text))
-
-                if exterior_coords:
-                    print(f"Original exterior coordinates: {exterior_coords[:2] if exterior_coords else 'None'}")
-
-                    transformed_exterior = transform_coordinates_to_wgs84(exterior_coords, source_crs)
-
-                    coordinates = [transformed_exterior]
-
-                    if interior_coords:
-                        transformed_interior = []
-                        for interior in interior_coords:
-                            transformed_interior.append(transform_coordinates_to_wgs84(interior, source_crs))
-                        coordinates.extend(transformed_interior)
-
-                    return {
-                        "type": "Polygon",
-                        "coordinates": coordinates
-                    }
-
-            elif 'Point' in child.tag:
-                for coord_elem in child.iter():
-                    if coord_elem.text and any(keyword in coord_elem.tag for keyword in ['coordinates', 'pos']):
-                        coord_text = coord_elem.text.strip()
-                        coords = None
-
-                        if ',' in coord_text:
-                            parts = coord_text.split(',')
-                            if len(parts) >= 2:
-                                coords = [[float(parts[0]), float(parts[1])]]
-                        else:
-                            coords_list = coord_text.split()
-                            if len(coords_list) >= 2:
-                                coords = [[float(coords_list[0]), float(coords_list[1])]]
-
-                        if coords:
-                            transformed_coords = transform_coordinates_to_wgs84(coords, source_crs)
-                            return {
-                                "type": "Point",
-                                "coordinates": transformed_coords[0] if transformed_coords else coords[0]
-                            }
-
-            elif 'LineString' in child.tag or 'Line' in child.tag:
-                for coord_elem in child.iter():
-                    if coord_elem.text and any(keyword in coord_elem.tag for keyword in ['coordinates', 'posList']):
-                        coords = extract_coordinates(coord_elem.text)
-                        if coords:
-                            transformed_coords = transform_coordinates_to_wgs84(coords, source_crs)
-                            return {
-                                "type": "LineString",
-                                "coordinates": transformed_coords if transformed_coords else coords
-                            }
+    except ET.ParseError as e:
+        logger.warning("error parsing geometry error=%s", e)
+        return None
+    return geometry_element_to_geojson(root)[1]
+
+
+def _round_coordinates(coords: List[Any], precision: int) -> List[Any]:
+    if coords and not isinstance(coords[0], list):
+        return [round(c, precision) for c in coords]
+    return [_round_coordinates(c, precision) for c in coords]
+
+
+def round_geometry(geometry: Optional[Dict[str, Any]], precision: Optional[int]) -> Optional[Dict[str, Any]]:
+    if not geometry or precision is None:
+        return geometry
+    return {**geometry, 'coordinates': _round_coordinates(geometry['coordinates'], precision)}
+
+
+def _within_budget(geom: Any, max_vertices: int) -> Any:
+    if shapely.get_num_coordinates(geom) <= max_vertices:
+        return geom
+    minx, miny, maxx, maxy = geom.bounds
+    high = max(maxx - minx, maxy - miny)
+    low = high * 1e-9
+    best = shapely.simplify(geom, high, preserve_topology=True)
+    if shapely.get_num_coordinates(best) > max_vertices:
+        return best
+    for _ in range(settings.SIMPLIFY_SEARCH_STEPS):
+        middle = math.sqrt(low * high)
+        candidate = shapely.simplify(geom, middle, preserve_topology=True)
+        vertices = shapely.get_num_coordinates(candidate)
+        if vertices <= max_vertices:
+            best, high = candidate, middle
+            if vertices > max_vertices * 0.9:
+                break
+        else:
+            low = middle
+    return best
 
-    except Exception as e:
-        print(f"Error parsing geometry: {e}")
 
-    return None
+def simplify_geometry(geometry: Optional[Dict[str, Any]], tolerance: Optional[float] = None,
+                      max_vertices: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    if not geometry or (tolerance is None and max_vertices is None):
+        return geometry
+    try:
+        original = geom = shape(geometry)
+        if tolerance is not None:
+            geom = shapely.simplify(geom, tolerance, preserve_topology=True)
+        if max_vertices is not None:
+            geom = _within_budget(geom, max_vertices)
+    except (ValueError, TypeError, KeyError, shapely.errors.GEOSException) as e:
+        logger.warning("error simplifying geometry error=%s", e)
+        return geometry
+    if geom is original or geom.is_empty:
+        return geometry
+    return orjson.loads(shapely.to_geojson(geom))
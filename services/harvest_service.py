@@ -0,0 +1,88 @@
+import logging
+from contextlib import aclosing
+from typing import Optional, Dict, Any, List
+
+from config import settings
+from utils import get_registry
+from .capabilities import get_capabilities, matching_feature_types
+from .layer_cache import layer_cache
+from .mirror import MirrorStore, get_mirror
+from .wfs_service import iter_layer_page, count_layer
+
+logger = logging.getLogger(__name__)
+
+
+async def _harvest_layer(store: MirrorStore, url: str, entity_type: str) -> Optional[Dict[str, Any]]:
+    caps = await get_capabilities(url)
+    if not caps:
+        logger.warning("harvest skipped, no capabilities url=%s", url)
+        return None
+
+    layers = settings.BUILDING_LAYER_NAMES if entity_type == 'building' else settings.PARCEL_LAYER_NAMES
+    names = matching_feature_types(caps, layers)
+    known = layer_cache.get(url, entity_type)
+    if known and known['layer'] in caps['feature_types']:
+        names = [known['layer']] + [n for n in names if n != known['layer']]
+    if not names:
+        logger.warning("harvest skipped, no %s layer url=%s", entity_type, url)
+        return None
+
+    layer = names[0]
+    if '2.0.0' not in (caps['versions'] or []):
+        logger.warning("harvest skipped, WFS 2.0 paging not supported url=%s", url)
+        return None
+    version = '2.0.0'
+
+    total = await count_layer(url, layer, version)
+    sync_id, start = store.begin_sync(url, entity_type, layer, version)
+    page = settings.MIRROR_PAGE_SIZE
+    stats = {
+        'url': url, 'entity_type': entity_type, 'layer': layer, 'total': total,
+        'changed': 0, 'unchanged': 0, 'removed': 0, 'complete': False
+    }
+
+    previous: List[str] = []
+    while total is None or start < total:
+        features = []
+        ids = []
+        async with aclosing(iter_layer_page(url, entity_type, layer, version, start, page)) as results:
+            async for entity_id, data in results:
+                ids.append(entity_id)
+                if entity_id:
+                    features.append((entity_id, data))
+        if not ids:
+            break
+        if ids == previous:
+            logger.warning("harvest aborted, page repeated url=%s layer=%s start=%d", url, layer, start)
+            return stats
+        previous = ids
+
+        start += len(ids)
+        changed, unchanged = store.store_page(sync_id, url, entity_type, features, start)
+        stats['changed'] += changed
+        stats['unchanged'] += unchanged
+        logger.info("harvested page url=%s layer=%s next_start=%d changed=%d unchanged=%d",
+                    url, layer, start, changed, unchanged)
+
+    if total is not None and start != total:
+        logger.warning("harvest incomplete url=%s layer=%s harvested=%d total=%d", url, layer, start, total)
+        return stats
+
+    stats['removed'] = store.finish_sync(sync_id, url, entity_type)
+    stats['complete'] = True
+    return stats
+
+
+async def harvest(teryt: str, entity_types: List[str]) -> List[Dict[str, Any]]:
+    services = get_registry(settings.WFS_DATA_FILE).services_for(teryt)
+    if not services:
+        raise ValueError(f"No WFS service found for TERYT code: {teryt}")
+
+    store = get_mirror(teryt, create=True)
+    results = []
+    for service in services:
+        for entity_type in entity_types:
+            stats = await _harvest_layer(store, service['url'], entity_type)
+            if stats:
+                results.append(stats)
+    return results
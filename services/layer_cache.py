@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+from typing import Optional, Dict
+
+from config import settings
+from utils.metrics import cache_requests_total
+
+
+class LayerCache:
+    def __init__(self, path: str, max_misses: int):
+        self.path = path
+        self.max_misses = max_misses
+        self._entries: Optional[Dict[str, Dict[str, str]]] = None
+        self._misses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url: str, entity_type: str) -> str:
+        return f"{entity_type}|{url}"
+
+    def _load(self) -> Dict[str, Dict[str, str]]:
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, url: str, entity_type: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            entry = self._load().get(self._key(url, entity_type))
+        cache_requests_total.inc(cache='layer', result='hit' if entry else 'miss')
+        return entry
+
+    def store(self, url: str, entity_type: str, layer: str, version: str, field: str) -> None:
+        key = self._key(url, entity_type)
+        entry = {'layer': layer, 'version': version, 'field': field}
+        with self._lock:
+            entries = self._load()
+            self._misses.pop(key, None)
+            if entries.get(key) == entry:
+                return
+            entries[key] = entry
+            self._save()
+
+    def record_hit(self, url: str, entity_type: str) -> None:
+        with self._lock:
+            self._misses.pop(self._key(url, entity_type), None)
+
+    def record_miss(self, url: str, entity_type: str) -> bool:
+        key = self._key(url, entity_type)
+        with self._lock:
+            self._misses[key] = self._misses.get(key, 0) + 1
+            if self._misses[key] < self.max_misses:
+                return True
+        self.invalidate(url, entity_type)
+        return False
+
+    def invalidate(self, url: str, entity_type: str) -> None:
+        key = self._key(url, entity_type)
+        with self._lock:
+            entries = self._load()
+            self._misses.pop(key, None)
+            if entries.pop(key, None) is not None:
+                self._save()
+
+
+layer_cache = LayerCache(settings.LAYER_CACHE_FILE, settings.LAYER_CACHE_MAX_MISSES)
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple, Callable, Awaitable, Set
+
+from config import settings
+from utils.metrics import cache_requests_total
+
+CacheKey = Tuple[str, str, str]
+
+
+class LookupCache:
+    def __init__(self, max_entries: int, ttl: float, stale_ttl: float, negative_ttl: float,
+                 disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.disk_path = disk_path
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._missing: "OrderedDict[CacheKey, float]" = OrderedDict()
+        self._pending: Dict[CacheKey, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._writes: Dict[CacheKey, Optional[Tuple[float, Dict[str, Any]]]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _disk(self) -> Optional[sqlite3.Connection]:
+        if not self.disk_path:
+            return None
+        if self._db is None:
+            directory = os.path.dirname(self.disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS lookups ("
+                "url TEXT, entity_type TEXT, entity_id TEXT, stored_at REAL, value TEXT, "
+                "PRIMARY KEY (url, entity_type, entity_id))"
+            )
+            self._db.commit()
+        return self._db
+
+    def _disk_get(self, key: CacheKey) -> Optional[Tuple[float, Dict[str, Any]]]:
+        with self._db_lock:
+            db = self._disk()
+            if db is None:
+                return None
+            row = db.execute(
+                "SELECT stored_at, value FROM lookups WHERE url = ? AND entity_type = ? AND entity_id = ?", key
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _disk_write(self, writes: Dict[CacheKey, Optional[Tuple[float, Dict[str, Any]]]]) -> None:
+        with self._db_lock:
+            db = self._disk()
+            if db is None:
+                return
+            for key, entry in writes.items():
+                if entry is None:
+                    db.execute("DELETE FROM lookups WHERE url = ? AND entity_type = ? AND entity_id = ?", key)
+                else:
+                    db.execute(
+                        "INSERT OR REPLACE INTO lookups (url, entity_type, entity_id, stored_at, value) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (*key, entry[0], json.dumps(entry[1]))
+                    )
+            db.commit()
+
+    def _write(self, key: CacheKey, entry: Optional[Tuple[float, Dict[str, Any]]]) -> None:
+        if not self.disk_path:
+            return
+        self._writes[key] = entry
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush())
+
+    async def _flush(self) -> None:
+        loop = asyncio.get_event_loop()
+        while self._writes:
+            writes, self._writes = self._writes, {}
+            await loop.run_in_executor(None, self._disk_write, writes)
+
+    async def _get(self, key: CacheKey) -> Optional[Tuple[float, Dict[str, Any]]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        if not self.disk_path:
+            return None
+        if key in self._writes:
+            entry = self._writes[key]
+        else:
+            entry = await asyncio.get_event_loop().run_in_executor(None, self._disk_get, key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: CacheKey, entry: Tuple[float, Dict[str, Any]]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, key: CacheKey, value: Dict[str, Any]) -> None:
+        stored_at = time.time()
+        self._missing.pop(key, None)
+        self._remember(key, (stored_at, value))
+        self._write(key, (stored_at, value))
+
+    def evict(self, key: CacheKey) -> None:
+        self._entries.pop(key, None)
+        self._write(key, None)
+
+    def put_missing(self, key: CacheKey) -> None:
+        self._missing[key] = time.time()
+        self._missing.move_to_end(key)
+        while len(self._missing) > self.max_entries:
+            self._missing.popitem(last=False)
+
+    def is_missing(self, key: CacheKey) -> bool:
+        missing_at = self._missing.get(key)
+        if missing_at is None:
+            return False
+        if time.time() - missing_at < self.negative_ttl:
+            return True
+        self._missing.pop(key, None)
+        return False
+
+    async def peek(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        entry = await self._get(key)
+        if entry is None or time.time() - entry[0] >= self.ttl + self.stale_ttl:
+            cache_requests_total.inc(cache='lookup', result='miss')
+            return None
+        cache_requests_total.inc(cache='lookup', result='hit')
+        return entry[1]
+
+    async def _run(self, key: CacheKey, fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> Optional[
+            Dict[str, Any]]:
+        try:
+            value = await fetch()
+            if value is not None:
+                self.put(key, value)
+            else:
+                self.evict(key)
+                self.put_missing(key)
+            return value
+        finally:
+            self._pending.pop(key, None)
+
+    def _start(self, key: CacheKey, fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> asyncio.Task:
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.ensure_future(self._run(key, fetch))
+        return task
+
+    def _refresh(self, key: CacheKey, fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> None:
+        if key in self._pending:
+            return
+        task = self._start(key, fetch)
+        self._background.add(task)
+        task.add_done_callback(self._refreshed)
+
+    def _refreshed(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled():
+            task.exception()
+
+    async def get_or_fetch(self, key: CacheKey, fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> Optional[
+            Dict[str, Any]]:
+        if self.is_missing(key):
+            cache_requests_total.inc(cache='lookup', result='negative')
+            return None
+        entry = await self._get(key)
+        if entry is not None:
+            age = time.time() - entry[0]
+            if age < self.ttl:
+                cache_requests_total.inc(cache='lookup', result='hit')
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                cache_requests_total.inc(cache='lookup', result='stale')
+                self._refresh(key, fetch)
+                return entry[1]
+        cache_requests_total.inc(cache='lookup', result='miss')
+        return await asyncio.shield(self._start(key, fetch))
+
+
+lookup_cache = LookupCache(
+    settings.LOOKUP_CACHE_MAX_ENTRIES,
+    settings.LOOKUP_CACHE_TTL,
+    settings.LOOKUP_CACHE_STALE_TTL,
+    settings.NEGATIVE_CACHE_TTL,
+    settings.LOOKUP_CACHE_DISK_PATH
+)
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple, Set
+
+from shapely.geometry import shape
+
+from config import settings
+from utils import get_teryt_from_id
+from utils.metrics import cache_requests_total
+
+Bbox = Tuple[float, float, float, float]
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS features ("
+    "id INTEGER PRIMARY KEY, url TEXT NOT NULL, entity_type TEXT NOT NULL, entity_id TEXT NOT NULL, "
+    "hash TEXT NOT NULL, data TEXT NOT NULL, sync_id INTEGER NOT NULL, "
+    "UNIQUE (url, entity_type, entity_id))",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS features_rtree USING rtree(id, minx, maxx, miny, maxy)",
+    "CREATE TABLE IF NOT EXISTS syncs ("
+    "id INTEGER PRIMARY KEY, url TEXT NOT NULL, entity_type TEXT NOT NULL, layer TEXT NOT NULL, "
+    "version TEXT NOT NULL, started_at REAL NOT NULL, completed_at REAL, next_start INTEGER NOT NULL DEFAULT 0)"
+)
+
+
+def _digest(data: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def _bounds(geometry: Optional[Dict[str, Any]]) -> Optional[Bbox]:
+    if not geometry:
+        return None
+    try:
+        return shape(geometry).bounds
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class MirrorStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+            self._db.commit()
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def is_complete(self, url: str, entity_type: str) -> bool:
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT 1 FROM syncs WHERE url = ? AND entity_type = ? AND completed_at IS NOT NULL LIMIT 1",
+                (url, entity_type)
+            ).fetchone()
+        return row is not None
+
+    def complete_urls(self, entity_type: str) -> Set[str]:
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT DISTINCT url FROM syncs WHERE entity_type = ? AND completed_at IS NOT NULL", (entity_type,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def get_many(self, url: str, entity_type: str, entity_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        with self._lock:
+            db = self._conn()
+            for i in range(0, len(entity_ids), 500):
+                chunk = entity_ids[i:i + 500]
+                rows = db.execute(
+                    "SELECT entity_id, data FROM features WHERE url = ? AND entity_type = ? "
+                    f"AND entity_id IN ({','.join('?' * len(chunk))})",
+                    (url, entity_type, *chunk)
+                ).fetchall()
+                found.update((entity_id, json.loads(data)) for entity_id, data in rows)
+        return found
+
+    def query_bbox(self, entity_type: str, bbox: Bbox) -> List[Tuple[str, str, Dict[str, Any]]]:
+        minx, miny, maxx, maxy = bbox
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT f.url, f.entity_id, f.data FROM features_rtree r JOIN features f ON f.id = r.id "
+                "WHERE f.entity_type = ? AND r.minx <= ? AND r.maxx >= ? AND r.miny <= ? AND r.maxy >= ?",
+                (entity_type, maxx, minx, maxy, miny)
+            ).fetchall()
+        return [(url, entity_id, json.loads(data)) for url, entity_id, data in rows]
+
+    def begin_sync(self, url: str, entity_type: str, layer: str, version: str) -> Tuple[int, int]:
+        with self._lock:
+            db = self._conn()
+            row = db.execute(
+                "SELECT id, next_start FROM syncs WHERE url = ? AND entity_type = ? AND layer = ? "
+                "AND completed_at IS NULL ORDER BY id DESC LIMIT 1",
+                (url, entity_type, layer)
+            ).fetchone()
+            if row:
+                return row[0], row[1]
+            cursor = db.execute(
+                "INSERT INTO syncs (url, entity_type, layer, version, started_at) VALUES (?, ?, ?, ?, ?)",
+                (url, entity_type, layer, version, time.time())
+            )
+            db.commit()
+            return cursor.lastrowid, 0
+
+    def store_page(self, sync_id: int, url: str, entity_type: str,
+                   features: List[Tuple[str, Dict[str, Any]]], next_start: int) -> Tuple[int, int]:
+        changed = unchanged = 0
+        with self._lock:
+            db = self._conn()
+            for entity_id, data in features:
+                digest = _digest(data)
+                row = db.execute(
+                    "SELECT id, hash FROM features WHERE url = ? AND entity_type = ? AND entity_id = ?",
+                    (url, entity_type, entity_id)
+                ).fetchone()
+                if row and row[1] == digest:
+                    db.execute("UPDATE features SET sync_id = ? WHERE id = ?", (sync_id, row[0]))
+                    unchanged += 1
+                    continue
+
+                payload = json.dumps(data)
+                if row:
+                    feature_id = row[0]
+                    db.execute("UPDATE features SET hash = ?, data = ?, sync_id = ? WHERE id = ?",
+                               (digest, payload, sync_id, feature_id))
+                    db.execute("DELETE FROM features_rtree WHERE id = ?", (feature_id,))
+                else:
+                    feature_id = db.execute(
+                        "INSERT INTO features (url, entity_type, entity_id, hash, data, sync_id) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (url, entity_type, entity_id, digest, payload, sync_id)
+                    ).lastrowid
+                bounds = _bounds(data.get('geometry'))
+                if bounds:
+                    minx, miny, maxx, maxy = bounds
+                    db.execute("INSERT INTO features_rtree (id, minx, maxx, miny, maxy) VALUES (?, ?, ?, ?, ?)",
+                               (feature_id, minx, maxx, miny, maxy))
+                changed += 1
+            db.execute("UPDATE syncs SET next_start = ? WHERE id = ?", (next_start, sync_id))
+            db.commit()
+        return changed, unchanged
+
+    def finish_sync(self, sync_id: int, url: str, entity_type: str) -> int:
+        with self._lock:
+            db = self._conn()
+            stale = "SELECT id FROM features WHERE url = ? AND entity_type = ? AND sync_id != ?"
+            db.execute(f"DELETE FROM features_rtree WHERE id IN ({stale})", (url, entity_type, sync_id))
+            removed = db.execute(
+                "DELETE FROM features WHERE url = ? AND entity_type = ? AND sync_id != ?",
+                (url, entity_type, sync_id)
+            ).rowcount
+            db.execute("UPDATE syncs SET completed_at = ? WHERE id = ?", (time.time(), sync_id))
+            db.execute("DELETE FROM syncs WHERE url = ? AND entity_type = ? AND id != ?", (url, entity_type, sync_id))
+            db.commit()
+        return removed
+
+
+_stores: Dict[str, MirrorStore] = {}
+_available: Optional[Set[str]] = None
+_scanned_at = 0.0
+
+
+def mirror_path(teryt: str) -> str:
+    return os.path.join(settings.MIRROR_DIR, f"{teryt}.sqlite")
+
+
+def scan_mirrors() -> None:
+    global _available, _scanned_at
+    try:
+        names = os.listdir(settings.MIRROR_DIR)
+    except FileNotFoundError:
+        names = []
+    _available = {name[:-7] for name in names if name.endswith('.sqlite')}
+    _scanned_at = time.monotonic()
+
+
+def _available_teryts() -> Set[str]:
+    if _available is None or time.monotonic() - _scanned_at >= settings.MIRROR_SCAN_INTERVAL:
+        scan_mirrors()
+    return _available
+
+
+def get_mirror(teryt: str, create: bool = False) -> Optional[MirrorStore]:
+    store = _stores.get(teryt)
+    if store is None:
+        available = _available_teryts()
+        if not create and teryt not in available:
+            return None
+        store = _stores.setdefault(teryt, MirrorStore(mirror_path(teryt)))
+        available.add(teryt)
+    return store
+
+
+def list_mirrors() -> List[MirrorStore]:
+    return [get_mirror(teryt) for teryt in sorted(_available_teryts())]
+
+
+def _lookup_many(store: MirrorStore, url: str, entity_type: str, entity_ids: List[str]) -> Tuple[
+        bool, Dict[str, Dict[str, Any]]]:
+    return store.is_complete(url, entity_type), store.get_many(url, entity_type, entity_ids)
+
+
+async def mirror_lookup_many(url: str, entity_type: str, entity_ids: List[str]) -> Dict[
+        str, Optional[Dict[str, Any]]]:
+    groups: Dict[str, List[str]] = {}
+    for entity_id in entity_ids:
+        groups.setdefault(get_teryt_from_id(entity_id), []).append(entity_id)
+
+    loop = asyncio.get_event_loop()
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+    for teryt, ids in groups.items():
+        store = get_mirror(teryt)
+        if store is None:
+            continue
+        covered, found = await loop.run_in_executor(None, _lookup_many, store, url, entity_type, ids)
+        for entity_id in ids:
+            if entity_id in found:
+                cache_requests_total.inc(cache='mirror', result='hit')
+                results[entity_id] = found[entity_id]
+            elif covered:
+                cache_requests_total.inc(cache='mirror', result='miss')
+                results[entity_id] = None
+            else:
+                cache_requests_total.inc(cache='mirror', result='partial')
+    return results
+
+
+async def mirror_lookup(url: str, entity_type: str, entity_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    results = await mirror_lookup_many(url, entity_type, [entity_id])
+    return entity_id in results, results.get(entity_id)
+
+
+def _query(stores: List[MirrorStore], entity_type: str, bbox: Bbox) -> Tuple[
+        List[Tuple[str, str, Dict[str, Any]]], Set[str]]:
+    features = []
+    complete = set()
+    for store in stores:
+        features.extend(store.query_bbox(entity_type, bbox))
+        complete.update(store.complete_urls(entity_type))
+    return features, complete
+
+
+async def query_mirrors(entity_type: str, bbox: Bbox) -> Tuple[List[Tuple[str, str, Dict[str, Any]]], Set[str]]:
+    stores = list_mirrors()
+    if not stores:
+        return [], set()
+    return await asyncio.get_event_loop().run_in_executor(None, _query, stores, entity_type, bbox)
@@ -0,0 +1,62 @@
+import logging
+from contextlib import aclosing
+from typing import Optional, Dict, Any, Tuple
+
+from shapely.geometry import shape, Point
+
+from config import settings
+from utils import get_registry, get_teryt_from_id
+from .bbox_service import overlapping_services
+from .mirror import query_mirrors
+from .spatial_index import spatial_index
+from .wfs_service import iter_bbox_features
+
+logger = logging.getLogger(__name__)
+
+
+def _contains(data: Dict[str, Any], point: Point) -> bool:
+    try:
+        return data.get('geometry') is not None and shape(data['geometry']).intersects(point)
+    except (ValueError, TypeError, KeyError):
+        return False
+
+
+def _service(url: str, entity_id: Optional[str]) -> Optional[Dict[str, str]]:
+    services = get_registry(settings.WFS_DATA_FILE).services_for_url(url)
+    if entity_id:
+        for service in services:
+            if service['teryt'] == get_teryt_from_id(entity_id):
+                return service
+    return services[0] if services else None
+
+
+async def find_by_point(entity_type: str, lon: float, lat: float) -> Optional[
+        Tuple[Dict[str, str], str, Dict[str, Any]]]:
+    point = Point(lon, lat)
+
+    hit = spatial_index.query(entity_type, lon, lat)
+    if hit is None:
+        features, _ = await query_mirrors(entity_type, point.bounds)
+        hit = next(((url, entity_id, data) for url, entity_id, data in features if _contains(data, point)), None)
+    if hit:
+        url, entity_id, data = hit
+        service = _service(url, entity_id)
+        if service:
+            return service, entity_id, data
+
+    radius = settings.POINT_SEARCH_RADIUS
+    bbox = (lon - radius, lat - radius, lon + radius, lat + radius)
+    for plan in await overlapping_services(entity_type, bbox):
+        service = plan['service']
+        found = None
+        try:
+            async with aclosing(iter_bbox_features(
+                    service['url'], entity_type, plan['layer'], plan['version'], plan['bbox'])) as features:
+                async for entity_id, data in features:
+                    if found is None and entity_id and _contains(data, point):
+                        found = (_service(service['url'], entity_id) or service, entity_id, data)
+        except Exception as e:
+            logger.warning("point query failed url=%s layer=%s error=%s", service['url'], plan['layer'], e)
+        if found:
+            return found
+    return None
@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import Optional, Dict, Any, Tuple, AsyncIterator
+
+from config import settings
+from utils.metrics import cache_requests_total
+from .geometry_service import simplify_geometry
+
+VariantKey = Tuple[str, str, str, Optional[float], Optional[int]]
+Geometry = Dict[str, Any]
+
+
+def lod_variant(tolerance: Optional[float], max_vertices: Optional[int]) -> str:
+    if tolerance is None and max_vertices is None:
+        return ''
+    return f"simplify={tolerance or ''};max_vertices={max_vertices or ''}"
+
+
+class SimplifyCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[VariantKey, Tuple[Geometry, Geometry]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: VariantKey, geometry: Geometry) -> Optional[Geometry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is geometry or entry[0] == geometry):
+                self._entries.move_to_end(key)
+            else:
+                entry = None
+        cache_requests_total.inc(cache='simplify', result='hit' if entry else 'miss')
+        return entry[1] if entry else None
+
+    def put(self, key: VariantKey, geometry: Geometry, simplified: Geometry) -> None:
+        with self._lock:
+            self._entries[key] = (geometry, simplified)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+simplify_cache = SimplifyCache(settings.SIMPLIFY_CACHE_MAX_ENTRIES)
+
+
+def simplify_data(url: str, entity_type: str, entity_id: Optional[str], data: Optional[Dict[str, Any]],
+                  tolerance: Optional[float], max_vertices: Optional[int]) -> Optional[Dict[str, Any]]:
+    if not data or not data.get('geometry') or (tolerance is None and max_vertices is None):
+        return data
+    geometry = data['geometry']
+    if entity_id is None:
+        return {**data, 'geometry': simplify_geometry(geometry, tolerance, max_vertices)}
+
+    key = (url, entity_type, entity_id, tolerance, max_vertices)
+    simplified = simplify_cache.get(key, geometry)
+    if simplified is None:
+        simplified = simplify_geometry(geometry, tolerance, max_vertices)
+        simplify_cache.put(key, geometry, simplified)
+    return {**data, 'geometry': simplified}
+
+
+def simplify_item(item: Dict[str, Any], entity_type: str, tolerance: Optional[float],
+                  max_vertices: Optional[int]) -> Dict[str, Any]:
+    if not item['data']:
+        return item
+    data = simplify_data(item['service']['url'], entity_type, item['id'], item['data'], tolerance, max_vertices)
+    return {**item, 'data': data}
+
+
+async def simplify_items(items: AsyncIterator[Dict[str, Any]], entity_type: str, tolerance: Optional[float],
+                         max_vertices: Optional[int]) -> AsyncIterator[Dict[str, Any]]:
+    async with aclosing(items) as results:
+        async for item in results:
+            yield simplify_item(item, entity_type, tolerance, max_vertices)
+
+
+async def simplify_features(features: AsyncIterator[Tuple[Dict[str, str], Optional[str], Dict[str, Any]]],
+                            entity_type: str, tolerance: Optional[float], max_vertices: Optional[int]) -> AsyncIterator[
+        Tuple[Dict[str, str], Optional[str], Dict[str, Any]]]:
+    async with aclosing(features) as results:
+        async for service, entity_id, data in results:
+            yield service, entity_id, simplify_data(
+                service['url'], entity_type, entity_id, data, tolerance, max_vertices)
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple, Set
+
+from shapely import STRtree
+from shapely.geometry import shape, Point
+from shapely.geometry.base import BaseGeometry
+
+from config import settings
+from utils.metrics import cache_requests_total
+
+IndexKey = Tuple[str, str, str]
+
+
+class SpatialIndex:
+    def __init__(self, max_features: int, rebuild_threshold: int):
+        self.max_features = max_features
+        self.rebuild_threshold = rebuild_threshold
+        self._entries: "OrderedDict[IndexKey, Tuple[BaseGeometry, Dict[str, Any]]]" = OrderedDict()
+        self._tree: Optional[STRtree] = None
+        self._tree_keys: List[IndexKey] = []
+        self._pending: Set[IndexKey] = set()
+        self._building: Set[IndexKey] = set()
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def add(self, url: str, entity_type: str, entity_id: str, data: Dict[str, Any]) -> None:
+        if not data.get('geometry'):
+            return
+        try:
+            geom = shape(data['geometry'])
+        except (ValueError, TypeError, KeyError):
+            return
+
+        key = (url, entity_type, entity_id)
+        with self._lock:
+            self._pending.add(key)
+            self._entries[key] = (geom, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_features:
+                evicted, _ = self._entries.popitem(last=False)
+                self._pending.discard(evicted)
+                self._building.discard(evicted)
+            if self._rebuilding or len(self._pending) <= self.rebuild_threshold:
+                return
+            self._rebuilding = True
+            self._building = self._pending
+            self._pending = set()
+            keys = list(self._entries)
+            geoms = [self._entries[k][0] for k in keys]
+        asyncio.get_running_loop().run_in_executor(None, self._rebuild, keys, geoms)
+
+    def _rebuild(self, keys: List[IndexKey], geoms: List[BaseGeometry]) -> None:
+        try:
+            tree = STRtree(geoms)
+            with self._lock:
+                self._tree, self._tree_keys = tree, keys
+                self._building = set()
+        finally:
+            self._rebuilding = False
+
+    def query(self, entity_type: str, lon: float, lat: float) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+        point = Point(lon, lat)
+        with self._lock:
+            keys = [self._tree_keys[i] for i in self._tree.query(point)] if self._tree is not None else []
+            keys += self._building | self._pending
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and key[1] == entity_type and entry[0].intersects(point):
+                    cache_requests_total.inc(cache='spatial_index', result='hit')
+                    return key[0], key[2], entry[1]
+        cache_requests_total.inc(cache='spatial_index', result='miss')
+        return None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+spatial_index = SpatialIndex(settings.POINT_INDEX_MAX_FEATURES, settings.POINT_INDEX_REBUILD_THRESHOLD)
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.geometry.base import BaseGeometry
+
+from config import settings
+from utils.metrics import cache_requests_total
+from .bbox_service import overlapping_services
+from .geometry_service import get_transformer
+from .mirror import query_mirrors
+from .wfs_service import iter_bbox_features
+
+logger = logging.getLogger(__name__)
+
+TileKey = Tuple[int, int, int, Tuple[str, ...]]
+
+EXTENT = 4096
+_MERCATOR = 20037508.342789244
+TILE_LAYERS = {'parcels': 'parcel', 'buildings': 'building'}
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[Tuple[float, float, float, float], Tuple[float, float, float, float]]:
+    n = 2 ** z
+    size = 2 * _MERCATOR / n
+    minx = -_MERCATOR + x * size
+    maxy = _MERCATOR - y * size
+    mercator = (minx, maxy - size, minx + size, maxy)
+
+    def lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    wgs84 = (x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y))
+    return wgs84, mercator
+
+
+class TileCache:
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[TileKey, Tuple[float, bytes]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: TileKey) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] >= self.ttl:
+                self._entries.pop(key)
+                self._size -= len(entry[1])
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        cache_requests_total.inc(cache='tile', result='hit' if entry else 'miss')
+        return entry[1] if entry else None
+
+    def put(self, key: TileKey, tile: bytes) -> None:
+        if len(tile) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            self._entries[key] = (time.time(), tile)
+            self._size += len(tile)
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+tile_cache = TileCache(settings.TILE_CACHE_MAX_BYTES, settings.TILE_MAX_AGE)
+
+
+async def _layer_features(entity_type: str, bbox: Tuple[float, float, float, float]) -> Tuple[
+        List[Tuple[str, Optional[str], Dict[str, Any]]], bool]:
+    features, complete = await query_mirrors(entity_type, bbox)
+
+    async def fetch(plan: Dict[str, Any]) -> Tuple[List[Tuple[str, Optional[str], Dict[str, Any]]], bool]:
+        url = plan['service']['url']
+        results = []
+        try:
+            async with aclosing(iter_bbox_features(
+                    url, entity_type, plan['layer'], plan['version'], plan['bbox'])) as stream:
+                async for entity_id, data in stream:
+                    results.append((url, entity_id, data))
+        except Exception as e:
+            logger.warning("tile query failed url=%s layer=%s error=%s", url, plan['layer'], e)
+            return results, False
+        return results, True
+
+    plans = [
+        p for p in await overlapping_services(entity_type, bbox)
+        if p['service']['url'] not in complete
+    ]
+    ok = True
+    for results, fetched in await asyncio.gather(*(fetch(p) for p in plans)):
+        features.extend(results)
+        ok = ok and fetched
+    return features, ok
+
+
+def _to_mercator(geom: BaseGeometry) -> BaseGeometry:
+    transformer = get_transformer('EPSG:4326', 'EPSG:3857')
+    return shapely.transform(geom, lambda c: np.column_stack(transformer.transform(c[:, 0], c[:, 1])))
+
+
+def encode_tile(layers: Dict[str, List[Tuple[str, Optional[str], Dict[str, Any]]]],
+                mercator: Tuple[float, float, float, float]) -> bytes:
+    import mapbox_vector_tile
+
+    minx, miny, maxx, maxy = mercator
+    margin = (maxx - minx) * settings.TILE_BUFFER / EXTENT
+    clip = (minx - margin, miny - margin, maxx + margin, maxy + margin)
+
+    encoded = []
+    for name, features in layers.items():
+        seen = set()
+        tile_features = []
+        for url, entity_id, data in features:
+            if not data.get('geometry') or (url, entity_id) in seen:
+                continue
+            seen.add((url, entity_id))
+            try:
+                geom = shapely.clip_by_rect(_to_mercator(shape(data['geometry'])), *clip)
+            except (ValueError, TypeError, KeyError):
+                continue
+            if geom.is_empty:
+                continue
+            tile_features.append({'geometry': geom, 'properties': {'id': entity_id or ''}})
+        encoded.append({'name': name, 'features': tile_features})
+
+    return mapbox_vector_tile.encode(encoded, default_options={'quantize_bounds': mercator, 'extents': EXTENT})
+
+
+_pending: Dict[TileKey, asyncio.Task] = {}
+
+
+async def _render(key: TileKey) -> Tuple[bytes, bool]:
+    z, x, y, layers = key
+    try:
+        wgs84, mercator = tile_bounds(z, x, y)
+        complete = True
+        if z < settings.TILE_MIN_ZOOM:
+            features = {name: [] for name in layers}
+        else:
+            results = await asyncio.gather(*(_layer_features(TILE_LAYERS[name], wgs84) for name in layers))
+            features = {name: found for name, (found, _) in zip(layers, results)}
+            complete = all(ok for _, ok in results)
+
+        tile = await asyncio.get_event_loop().run_in_executor(None, encode_tile, features, mercator)
+        if complete:
+            tile_cache.put(key, tile)
+        return tile, complete
+    finally:
+        _pending.pop(key, None)
+
+
+async def get_tile(z: int, x: int, y: int, layers: Tuple[str, ...]) -> Tuple[bytes, bool]:
+    key = (z, x, y, layers)
+    cached = tile_cache.get(key)
+    if cached is not None:
+        return cached, True
+
+    task = _pending.get(key)
+    if task is None:
+        task = _pending[key] = asyncio.ensure_future(_render(key))
+    return await asyncio.shield(task)
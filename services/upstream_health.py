@@ -0,0 +1,86 @@
+import time
+from typing import Optional, Dict
+from urllib.parse import urlsplit
+
+from config import settings
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class UpstreamUnavailableError(Exception):
+    pass
+
+
+class HostHealth:
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.latency_dev = 0.0
+
+
+class UpstreamHealth:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._hosts: Dict[str, HostHealth] = {}
+
+    def _host(self, url: str) -> HostHealth:
+        host = urlsplit(url).netloc
+        health = self._hosts.get(host)
+        if health is None:
+            health = self._hosts[host] = HostHealth()
+        return health
+
+    def is_open(self, url: str) -> bool:
+        health = self._host(url)
+        return health.state == OPEN and time.monotonic() - health.opened_at < self.reset_timeout
+
+    def allow(self, url: str) -> bool:
+        health = self._host(url)
+        now = time.monotonic()
+        if health.state == CLOSED:
+            return True
+        if health.state == OPEN:
+            if now - health.opened_at < self.reset_timeout:
+                return False
+            health.state = HALF_OPEN
+            health.trial_started = None
+        if health.trial_started is not None and now - health.trial_started < self.reset_timeout:
+            return False
+        health.trial_started = now
+        return True
+
+    def timeout(self, url: str) -> float:
+        health = self._host(url)
+        if health.latency is None:
+            return settings.REQUEST_TIMEOUT
+        adaptive = health.latency + settings.ADAPTIVE_TIMEOUT_MULTIPLIER * health.latency_dev
+        return min(settings.REQUEST_TIMEOUT, max(settings.ADAPTIVE_TIMEOUT_MIN, adaptive))
+
+    def record_success(self, url: str, elapsed: float) -> None:
+        health = self._host(url)
+        if health.latency is None:
+            health.latency = elapsed
+            health.latency_dev = elapsed / 2
+        else:
+            health.latency_dev = 0.75 * health.latency_dev + 0.25 * abs(elapsed - health.latency)
+            health.latency = 0.875 * health.latency + 0.125 * elapsed
+        health.state = CLOSED
+        health.failures = 0
+        health.trial_started = None
+
+    def record_failure(self, url: str) -> None:
+        health = self._host(url)
+        health.failures += 1
+        if health.state == HALF_OPEN or health.failures >= self.failure_threshold:
+            health.state = OPEN
+            health.opened_at = time.monotonic()
+            health.trial_started = None
+
+
+upstream_health = UpstreamHealth(settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RESET_TIMEOUT)
@@ -1,16 +1,45 @@
+import asyncio
+import logging
+import time
 import xml.etree.ElementTree as ET
-from typing import Optional, Dict, Any, List
+from contextlib import aclosing
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator, Iterator
+from urllib.parse import urlsplit
+from xml.sax.saxutils import escape
 
 import httpx
 
 from config import settings
-from .geometry_service import parse_gml_geometry_to_geojson
+from utils.metrics import upstream_request_seconds, xml_parse_seconds, lookup_candidate_attempts
+from .capabilities import plausible_candidates, fetch_text
+from .crs_cache import crs_cache
+from .geometry_service import geometry_element_to_geojson
+from .http_client import get_client, host_limit
+from .layer_cache import layer_cache
+from .lookup_cache import lookup_cache
+from .mirror import mirror_lookup, mirror_lookup_many
+from .spatial_index import spatial_index
+from .upstream_health import upstream_health, UpstreamUnavailableError
 
 
 def _filter_xml(version: str, field: str, value: str) -> str:
     if version.startswith('2'):
-        return f"<fes:Filter xmlns:fes='http://www.opengis.net/fes/2.0'><fes:PropertyIsEqualTo><fes:PropertyName>{field}</fes:PropertyName><fes:Literal>{value}</fes:Literal></fes:PropertyIsEqualTo></fes:Filter>"
-    return f"<ogc:Filter xmlns:ogc='http://www.opengis.net/ogc'><ogc:PropertyIsEqualTo><ogc:PropertyName>{field}</ogc:PropertyName><ogc:Literal>{value}</ogc:Literal></ogc:PropertyIsEqualTo></ogc:Filter>"
+        return f"<fes:Filter xmlns:fes='http://www.opengis.net/fes/2.0'><fes:PropertyIsEqualTo><fes:PropertyName>{field}</fes:PropertyName><fes:Literal>{escape(value)}</fes:Literal></fes:PropertyIsEqualTo></fes:Filter>"
+    return f"<ogc:Filter xmlns:ogc='http://www.opengis.net/ogc'><ogc:PropertyIsEqualTo><ogc:PropertyName>{field}</ogc:PropertyName><ogc:Literal>{escape(value)}</ogc:Literal></ogc:PropertyIsEqualTo></ogc:Filter>"
+
+
+def _any_filter_xml(version: str, field: str, values: List[str]) -> str:
+    if len(values) == 1:
+        return _filter_xml(version, field, values[0])
+    if version.startswith('2'):
+        clauses = ''.join(
+            f"<fes:PropertyIsEqualTo><fes:PropertyName>{field}</fes:PropertyName><fes:Literal>{escape(v)}</fes:Literal></fes:PropertyIsEqualTo>"
+            for v in values)
+        return f"<fes:Filter xmlns:fes='http://www.opengis.net/fes/2.0'><fes:Or>{clauses}</fes:Or></fes:Filter>"
+    clauses = ''.join(
+        f"<ogc:PropertyIsEqualTo><ogc:PropertyName>{field}</ogc:PropertyName><ogc:Literal>{escape(v)}</ogc:Literal></ogc:PropertyIsEqualTo>"
+        for v in values)
+    return f"<ogc:Filter xmlns:ogc='http://www.opengis.net/ogc'><ogc:Or>{clauses}</ogc:Or></ogc:Filter>"
 
 
 def _build_params(layer: str, version: str, field: str, value: str, count: bool) -> Dict[str, str]:
@@ -27,83 +56,538 @@ def _build_params(layer: str, version: str, field: str, value: str, count: bool)
     return p
 
 
-def _parse_features(xml_text: str) -> List[ET.Element]:
-    root = ET.fromstring(xml_text.encode('utf-8'))
-    tags = [
-        '{http://www.opengis.net/wfs/2.0}member',
-        '{http://www.opengis.net/gml}featureMember',
-        '{http://www.opengis.net/gml/3.2}featureMember'
-    ]
-    members = []
-    for t in tags:
-        members.extend(root.findall(f'.//{t}'))
-    return members
+def _filter_chunks(url: str, layer: str, version: str, field: str, ids: List[str]) -> Iterator[
+        Tuple[List[str], Dict[str, str]]]:
+    chunk: List[str] = []
+    params: Dict[str, str] = {}
+    for entity_id in ids:
+        candidate = _build_params(layer, version, field, entity_id, True)
+        candidate['FILTER'] = _any_filter_xml(version, field, chunk + [entity_id])
+        if chunk and (len(chunk) >= settings.BATCH_FILTER_SIZE or
+                      len(str(httpx.URL(url, params=candidate))) > settings.BATCH_FILTER_MAX_URL_LENGTH):
+            yield chunk, params
+            chunk = []
+            candidate['FILTER'] = _filter_xml(version, field, entity_id)
+        chunk.append(entity_id)
+        params = candidate
+    if chunk:
+        yield chunk, params
+
+
+def _build_page_params(layer: str, version: str, bbox: Optional[str] = None, start: int = 0,
+                       count: Optional[int] = None, hits: bool = False) -> Dict[str, str]:
+    key = 'TYPENAMES' if version.startswith('2') else 'TYPENAME'
+    p = {
+        'SERVICE': 'WFS',
+        'VERSION': version,
+        'REQUEST': 'GetFeature',
+        key: layer
+    }
+    if bbox:
+        p['BBOX'] = bbox
+    if hits:
+        p['RESULTTYPE'] = 'hits'
+    if count:
+        p['COUNT' if version.startswith('2') else 'MAXFEATURES'] = str(count)
+    if start and version.startswith('2'):
+        p['STARTINDEX'] = str(start)
+    return p
+
+
+_MEMBER_TAGS = {
+    '{http://www.opengis.net/wfs/2.0}member',
+    '{http://www.opengis.net/gml}featureMember',
+    '{http://www.opengis.net/gml/3.2}featureMember'
+}
+_EXCEPTION_TAGS = ('ExceptionReport', 'ServiceExceptionReport')
+
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceExceptionError(Exception):
+    pass
+
+
+class UpstreamRequestError(Exception):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+async def _iter_members(client: httpx.AsyncClient, url: str, params: Dict[str, str]) -> AsyncIterator[ET.Element]:
+    if not upstream_health.allow(url):
+        raise UpstreamUnavailableError(f"WFS service {url} is temporarily unavailable")
+
+    labels = {'host': urlsplit(url).netloc, 'request': params['REQUEST'], 'version': params.get('VERSION', '')}
+    async with host_limit(url):
+        started = time.monotonic()
+        elapsed = None
+        parsing = 0.0
+        try:
+            async with client.stream('GET', url, params=params, timeout=upstream_health.timeout(url)) as r:
+                elapsed = time.monotonic() - started
+                upstream_request_seconds.observe(elapsed, status=str(r.status_code), **labels)
+                if r.status_code >= 500:
+                    upstream_health.record_failure(url)
+                else:
+                    upstream_health.record_success(url, elapsed)
+                if r.status_code != 200:
+                    raise UpstreamRequestError(f"HTTP {r.status_code} from {url}", r.status_code)
+
+                parser = ET.XMLPullParser(events=('start', 'end'))
+                stack: List[ET.Element] = []
+                async for chunk in r.aiter_bytes():
+                    parse_started = time.perf_counter()
+                    parser.feed(chunk)
+                    events = list(parser.read_events())
+                    parsing += time.perf_counter() - parse_started
+                    for event, elem in events:
+                        if event == 'start':
+                            if not stack and elem.tag.split('}')[-1] in _EXCEPTION_TAGS:
+                                raise ServiceExceptionError(f"Service exception from {url}")
+                            stack.append(elem)
+                            continue
+                        stack.pop()
+                        if elem.tag in _MEMBER_TAGS:
+                            yield elem
+                            elem.clear()
+                            if stack:
+                                stack[-1].remove(elem)
+                parser.close()
+        except httpx.TransportError:
+            if elapsed is None:
+                upstream_request_seconds.observe(time.monotonic() - started, status='error', **labels)
+            upstream_health.record_failure(url)
+            raise
+        finally:
+            if parsing:
+                xml_parse_seconds.observe(parsing, document='GetFeature')
+
+
+async def _find_in_stream(client: httpx.AsyncClient, url: str, params: Dict[str, str], entity_id: str) -> Optional[
+    Dict[str, Any]]:
+    async with aclosing(_iter_members(client, url, params)) as members:
+        async for m in members:
+            res = _build_result(m, entity_id, url, _layer_of(params))
+            if res:
+                return res
+    return None
 
 
-def _build_result(feature_member: ET.Element, entity_id: str) -> Optional[Dict[str, Any]]:
+def _feature_parts(feature_member: ET.Element) -> Tuple[Dict[str, str], Optional[ET.Element]]:
     feature = feature_member[0] if len(feature_member) else feature_member
     attrs = {}
-    geom_xml = None
+    geom = None
     for child in feature:
         name = child.tag.split('}')[-1]
         if any(g in name.lower() for g in ['geom', 'polygon', 'point', 'line', 'shape']):
-            geom_xml = ET.tostring(child, encoding='unicode')
+            geom = child
         elif name.lower() != 'boundedby':
             attrs[name] = child.text or ''
+    return attrs, geom
+
+
+def _layer_of(params: Dict[str, str]) -> str:
+    return params.get('TYPENAMES') or params.get('TYPENAME', '')
+
+
+def _to_result(attrs: Dict[str, str], geom: Optional[ET.Element], url: str, layer: str) -> Dict[str, Any]:
+    if geom is None:
+        return {'attributes': attrs, 'geometry': None}
+
+    known = crs_cache.get(url, layer)
+    method, geojson = geometry_element_to_geojson(geom, known)
+    if method and method != known:
+        crs_cache.store(url, layer, *method)
+    elif not method and known:
+        crs_cache.invalidate(url, layer)
+    return {'attributes': attrs, 'geometry': geojson}
+
+
+def _build_result(feature_member: ET.Element, entity_id: str, url: str, layer: str) -> Optional[Dict[str, Any]]:
+    attrs, geom = _feature_parts(feature_member)
     if entity_id in str(attrs.values()):
-        geojson = parse_gml_geometry_to_geojson(geom_xml) if geom_xml else None
-        return {'attributes': attrs, 'geometry': geojson}
+        return _to_result(attrs, geom, url, layer)
     return None
 
 
-async def _try_request(client: httpx.AsyncClient, url: str, params: Dict[str, str]) -> Optional[str]:
+async def _candidates(url: str, entity_type: str) -> List[Tuple[str, str, str]]:
+    if entity_type == 'building':
+        layers = settings.BUILDING_LAYER_NAMES
+        fields = [settings.BUILDING_ID_FIELD] + settings.FALLBACK_BUILDING_ID_FIELDS
+    else:
+        layers = settings.PARCEL_LAYER_NAMES
+        fields = [settings.PARCEL_ID_FIELD] + settings.FALLBACK_PARCEL_ID_FIELDS
+
+    if settings.CAPABILITIES_PROBE:
+        candidates = await plausible_candidates(url, layers, fields)
+        if candidates:
+            return candidates
+    return [(layer, v, f) for layer in layers for f in fields for v in settings.WFS_VERSIONS]
+
+
+def _failure_status(error: Exception) -> str:
+    if isinstance(error, (ServiceExceptionError, ET.ParseError)):
+        return 'rejected'
+    if isinstance(error, UpstreamRequestError) and error.status_code < 500:
+        return 'rejected'
+    return 'failed'
+
+
+async def _probe(url: str, layer: str, version: str, field: str, entity_id: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    client = get_client()
+    p = _build_params(layer, version, field, entity_id, False)
     try:
-        r = await client.get(url, params=params, timeout=settings.REQUEST_TIMEOUT)
-        if r.status_code != 200:
-            return None
+        res = await _find_in_stream(client, url, p, entity_id)
+        return ('found' if res else 'missing'), res
+    except ServiceExceptionError:
+        pass
+    except Exception as e:
+        return _failure_status(e), None
 
-        txt = r.text
-        if 'ServiceException' in txt or 'ExceptionReport' in txt:
-            p = {k: v for k, v in params.items() if k != 'FILTER'}
-            p.update({'COUNT' if params['VERSION'].startswith('2') else 'MAXFEATURES': str(settings.MAX_FEATURES)})
-            r = await client.get(url, params=p, timeout=settings.REQUEST_TIMEOUT)
-            if r.status_code != 200:
-                return None
-            txt = r.text
-        return txt
-    except Exception:
-        return None
+    p = {k: v for k, v in _build_params(layer, version, field, entity_id, True).items() if k != 'FILTER'}
+    try:
+        res = await _find_in_stream(client, url, p, entity_id)
+        return ('found' if res else 'missing'), res
+    except Exception as e:
+        return _failure_status(e), None
 
 
-async def _search_layer(url: str, layer: str, entity_id: str, field: str) -> Optional[Dict[str, Any]]:
-    async with httpx.AsyncClient(verify=False) as client:
-        for v in settings.WFS_VERSIONS:
-            p = _build_params(layer, v, field, entity_id, False)
-            txt = await _try_request(client, url, p)
-            if not txt:
-                continue
-            for m in _parse_features(txt):
-                res = _build_result(m, entity_id)
-                if res:
-                    return res
-    return None
+async def _probe_sequentially(url: str, candidates: List[Tuple[str, str, str]], entity_id: str) -> Tuple[
+        Optional[Tuple[Tuple[str, str, str], Dict[str, Any]]], bool, int]:
+    answered = False
+    for attempts, candidate in enumerate(candidates, 1):
+        status, res = await _probe(url, *candidate, entity_id)
+        if res:
+            return (candidate, res), True, attempts
+        answered = answered or status != 'failed'
+    return None, answered, len(candidates)
 
 
-async def _search_layer_fallback_fields(url: str, layers: List[str], entity_id: str, fields: List[str]) -> Optional[
-    Dict[str, Any]]:
-    for layer in layers:
-        for f in fields:
-            res = await _search_layer(url, layer, entity_id, f)
+async def _probe_concurrently(url: str, candidates: List[Tuple[str, str, str]], entity_id: str) -> Tuple[
+        Optional[Tuple[Tuple[str, str, str], Dict[str, Any]]], bool, int]:
+    sem = asyncio.Semaphore(settings.WFS_PROBE_CONCURRENCY)
+    attempts = 0
+
+    async def run(candidate: Tuple[str, str, str]) -> Tuple[Tuple[str, str, str], str, Optional[Dict[str, Any]]]:
+        nonlocal attempts
+        async with sem:
+            attempts += 1
+            status, res = await _probe(url, *candidate, entity_id)
+        return candidate, status, res
+
+    answered = False
+    tasks = [asyncio.create_task(run(c)) for c in candidates]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            candidate, status, res = await fut
             if res:
-                return res
+                return (candidate, res), True, attempts
+            answered = answered or status != 'failed'
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return None, answered, attempts
+
+
+async def _search(url: str, entity_type: str, entity_id: str) -> Optional[Dict[str, Any]]:
+    if upstream_health.is_open(url):
+        raise UpstreamUnavailableError(f"WFS service {url} is temporarily unavailable")
+
+    known = layer_cache.get(url, entity_type)
+    if known:
+        status, res = await _probe(url, known['layer'], known['version'], known['field'], entity_id)
+        if res:
+            layer_cache.record_hit(url, entity_type)
+            lookup_candidate_attempts.observe(1, entity_type=entity_type)
+            return res
+        if status == 'failed':
+            raise UpstreamUnavailableError(f"WFS service {url} did not respond")
+        if status == 'rejected':
+            layer_cache.invalidate(url, entity_type)
+        elif layer_cache.record_miss(url, entity_type):
+            lookup_candidate_attempts.observe(1, entity_type=entity_type)
+            return None
+
+    candidates = await _candidates(url, entity_type)
+    if known:
+        candidates = [c for c in candidates if c != (known['layer'], known['version'], known['field'])]
+
+    if settings.WFS_SEARCH_MODE == 'concurrent':
+        found, answered, attempts = await _probe_concurrently(url, candidates, entity_id)
+    else:
+        found, answered, attempts = await _probe_sequentially(url, candidates, entity_id)
+    lookup_candidate_attempts.observe(attempts + (1 if known else 0), entity_type=entity_type)
+
+    if found:
+        (layer, version, field), res = found
+        layer_cache.store(url, entity_type, layer, version, field)
+        return res
+    if candidates and not answered:
+        raise UpstreamUnavailableError(f"WFS service {url} did not respond")
     return None
 
 
+async def _fetch(url: str, entity_type: str, entity_id: str) -> Optional[Dict[str, Any]]:
+    res = await _search(url, entity_type, entity_id)
+    if res:
+        spatial_index.add(url, entity_type, entity_id, res)
+    return res
+
+
+async def _lookup(url: str, entity_type: str, entity_id: str) -> Optional[Dict[str, Any]]:
+    covered, mirrored = await mirror_lookup(url, entity_type, entity_id)
+    if covered:
+        return mirrored
+    return await lookup_cache.get_or_fetch(
+        (url, entity_type, entity_id),
+        lambda: _fetch(url, entity_type, entity_id)
+    )
+
+
 async def get_parcel_by_id(url: str, parcel_id: str) -> Optional[Dict[str, Any]]:
-    fields = [settings.PARCEL_ID_FIELD] + settings.FALLBACK_PARCEL_ID_FIELDS
-    return await _search_layer_fallback_fields(url, settings.PARCEL_LAYER_NAMES, parcel_id, fields)
+    return await _lookup(url, 'parcel', parcel_id)
 
 
 async def get_building_by_id(url: str, building_id: str) -> Optional[Dict[str, Any]]:
-    fields = [settings.BUILDING_ID_FIELD] + settings.FALLBACK_BUILDING_ID_FIELDS
-    return await _search_layer_fallback_fields(url, settings.BUILDING_LAYER_NAMES, building_id, fields)
+    return await _lookup(url, 'building', building_id)
+
+
+async def _iter_many(url: str, entity_type: str, ids: List[str]) -> AsyncIterator[
+        Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    pending = []
+    ids = list(dict.fromkeys(ids))
+    mirrored = await mirror_lookup_many(url, entity_type, ids)
+    for entity_id in ids:
+        if entity_id in mirrored:
+            if mirrored[entity_id] is not None:
+                yield entity_id, mirrored[entity_id], None
+            continue
+        cached = await lookup_cache.peek((url, entity_type, entity_id))
+        if cached is not None:
+            yield entity_id, cached, None
+        else:
+            pending.append(entity_id)
+
+    known = layer_cache.get(url, entity_type)
+    attempts = 0
+    while not known and pending and attempts < settings.BATCH_DISCOVERY_ATTEMPTS:
+        entity_id = pending[0]
+        attempts += 1
+        try:
+            res = await _lookup(url, entity_type, entity_id)
+        except UpstreamUnavailableError as e:
+            for entity_id in pending:
+                yield entity_id, None, str(e)
+            return
+        pending.pop(0)
+        if res:
+            yield entity_id, res, None
+        known = layer_cache.get(url, entity_type)
+
+    if not pending:
+        return
+    if not known:
+        for entity_id in pending:
+            yield entity_id, None, "No matching layer found for this service"
+        return
+
+    client = get_client()
+    layer, version, field = known['layer'], known['version'], known['field']
+    for chunk, p in _filter_chunks(url, layer, version, field, pending):
+        remaining = set(chunk)
+        found = []
+        rejected = False
+        failure = None
+        try:
+            async with aclosing(_iter_members(client, url, p)) as members:
+                async for m in members:
+                    attrs, geom = _feature_parts(m)
+                    entity_id = attrs.get(field)
+                    if entity_id not in remaining:
+                        values = str(attrs.values())
+                        entity_id = next((e for e in remaining if e in values), None)
+                    if entity_id is None:
+                        continue
+                    res = _to_result(attrs, geom, url, layer)
+                    lookup_cache.put((url, entity_type, entity_id), res)
+                    spatial_index.add(url, entity_type, entity_id, res)
+                    remaining.discard(entity_id)
+                    found.append((entity_id, res))
+                    if not remaining:
+                        break
+        except Exception as e:
+            if _failure_status(e) == 'rejected':
+                rejected = True
+            else:
+                failure = f"Upstream WFS request failed: {e}"
+
+        for entity_id, res in found:
+            yield entity_id, res, None
+        if failure:
+            for entity_id in remaining:
+                yield entity_id, None, failure
+        if not rejected or not remaining:
+            continue
+
+        sem = asyncio.Semaphore(settings.WFS_PROBE_CONCURRENCY)
+
+        async def single(entity_id: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+            async with sem:
+                try:
+                    return entity_id, await _lookup(url, entity_type, entity_id), None
+                except UpstreamUnavailableError as e:
+                    return entity_id, None, str(e)
+
+        tasks = [asyncio.create_task(single(e)) for e in remaining]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                entity_id, res, error = await fut
+                if res or error:
+                    yield entity_id, res, error
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _search_many(url: str, entity_type: str, ids: List[str]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    found: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, str] = {}
+    async with aclosing(_iter_many(url, entity_type, ids)) as results:
+        async for entity_id, res, error in results:
+            if res:
+                found[entity_id] = res
+            elif error:
+                errors[entity_id] = error
+    return found, errors
+
+
+async def get_parcels_by_ids(url: str, parcel_ids: List[str]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    return await _search_many(url, 'parcel', parcel_ids)
+
+
+async def get_buildings_by_ids(url: str, building_ids: List[str]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    return await _search_many(url, 'building', building_ids)
+
+
+def iter_parcels_by_ids(url: str, parcel_ids: List[str]) -> AsyncIterator[
+        Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    return _iter_many(url, 'parcel', parcel_ids)
+
+
+def iter_buildings_by_ids(url: str, building_ids: List[str]) -> AsyncIterator[
+        Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    return _iter_many(url, 'building', building_ids)
+
+
+async def _count_matches(url: str, params: Dict[str, str]) -> Optional[int]:
+    txt = await fetch_text(url, params)
+    if not txt:
+        return None
+    try:
+        root = ET.fromstring(txt.encode('utf-8'))
+    except ET.ParseError:
+        return None
+    for attr in ('numberMatched', 'numberOfFeatures'):
+        value = root.get(attr)
+        if value and value.isdigit():
+            return int(value)
+    return None
+
+
+async def _iter_features(url: str, entity_type: str, layer: str, params: Dict[str, str]) -> AsyncIterator[
+        Tuple[Optional[str], Dict[str, Any]]]:
+    known = layer_cache.get(url, entity_type)
+    field = known['field'] if known and known['layer'] == layer else None
+    if entity_type == 'building':
+        id_fields = [settings.BUILDING_ID_FIELD] + settings.FALLBACK_BUILDING_ID_FIELDS
+    else:
+        id_fields = [settings.PARCEL_ID_FIELD] + settings.FALLBACK_PARCEL_ID_FIELDS
+    id_fields = {f.replace('_', '').lower() for f in id_fields}
+
+    async with aclosing(_iter_members(get_client(), url, params)) as members:
+        async for m in members:
+            attrs, geom = _feature_parts(m)
+            if field:
+                entity_id = attrs.get(field)
+            else:
+                entity_id = next((v for k, v in attrs.items() if k.replace('_', '').lower() in id_fields), None)
+            yield entity_id, _to_result(attrs, geom, url, layer)
+
+
+async def count_layer(url: str, layer: str, version: str) -> Optional[int]:
+    return await _count_matches(url, _build_page_params(layer, version, hits=True))
+
+
+def iter_layer_page(url: str, entity_type: str, layer: str, version: str, start: int, count: int) -> AsyncIterator[
+        Tuple[Optional[str], Dict[str, Any]]]:
+    return _iter_features(url, entity_type, layer, _build_page_params(layer, version, start=start, count=count))
+
+
+async def iter_bbox_features(url: str, entity_type: str, layer: str, version: str, bbox: str) -> AsyncIterator[
+        Tuple[Optional[str], Dict[str, Any]]]:
+    page = settings.BBOX_PAGE_SIZE
+
+    async def fetch_page(params: Dict[str, str]) -> AsyncIterator[Tuple[Optional[str], Dict[str, Any]]]:
+        async with aclosing(_iter_features(url, entity_type, layer, params)) as features:
+            async for entity_id, res in features:
+                if entity_id:
+                    spatial_index.add(url, entity_type, entity_id, res)
+                yield entity_id, res
+
+    if not version.startswith('2'):
+        params = _build_page_params(layer, version, bbox, count=settings.BBOX_MAX_FEATURES)
+        async with aclosing(fetch_page(params)) as features:
+            async for feature in features:
+                yield feature
+        return
+
+    total = await _count_matches(url, _build_page_params(layer, version, bbox, hits=True))
+    if total is None:
+        for start in range(0, settings.BBOX_MAX_FEATURES, page):
+            received = 0
+            async with aclosing(fetch_page(_build_page_params(layer, version, bbox, start, page))) as features:
+                async for feature in features:
+                    received += 1
+                    yield feature
+            if received < page:
+                return
+        return
+
+    total = min(total, settings.BBOX_MAX_FEATURES)
+    sem = asyncio.Semaphore(settings.BBOX_PAGE_CONCURRENCY)
+    queue: "asyncio.Queue[Optional[Tuple[Optional[str], Dict[str, Any]]]]" = asyncio.Queue(
+        maxsize=settings.STREAM_QUEUE_SIZE)
+
+    async def run(start: int) -> None:
+        async with sem:
+            params = _build_page_params(layer, version, bbox, start, min(page, total - start))
+            try:
+                async with aclosing(fetch_page(params)) as features:
+                    async for feature in features:
+                        await queue.put(feature)
+            except (ServiceExceptionError, UpstreamRequestError, UpstreamUnavailableError, httpx.HTTPError,
+                    ET.ParseError) as e:
+                logger.warning("bbox page failed url=%s layer=%s start=%d error=%s", url, layer, start, e)
+
+    tasks = [asyncio.create_task(run(start)) for start in range(0, total, page)]
+
+    async def finish() -> None:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await queue.put(None)
+
+    done = asyncio.create_task(finish())
+    try:
+        while True:
+            feature = await queue.get()
+            if feature is None:
+                break
+            yield feature
+    finally:
+        for t in tasks:
+            t.cancel()
+        done.cancel()
+        await asyncio.gather(*tasks, done, return_exceptions=True)
@@ -1 +1,4 @@
-from .helpers import get_teryt_from_id, find_service_by_teryt
\ No newline at end of file
+from .helpers import get_teryt_from_id, find_service_by_teryt, find_services_by_teryt, parse_bbox
+from .registry import ServiceRegistry, get_registry
+from .metrics import render_metrics
+from .responses import FastJSONResponse, CompressionMiddleware
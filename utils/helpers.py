@@ -1,28 +1,28 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 
-import aiofiles
+from .metrics import registry_lookup_seconds
+from .registry import get_registry
 
 
 def get_teryt_from_id(entity_id: str) -> str:
     return entity_id[:4]
 
 
-async def find_service_by_teryt(file_path: str, teryt: str) -> Optional[Dict[str, str]]:
+def parse_bbox(text: str) -> Tuple[float, float, float, float]:
     try:
-        async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-            await f.readline()
-            content = await f.read()
-
-        lines = content.strip().split('\n')
-        for line in lines:
-            row = line.split(';')
-            if len(row) >= 4 and row[2] == teryt:
-                return {
-                    'id': row[0],
-                    'organization': row[1],
-                    'teryt': row[2],
-                    'url': row[3]
-                }
-    except FileNotFoundError:
-        return None
-    return None
+        minx, miny, maxx, maxy = (float(v) for v in text.split(','))
+    except ValueError:
+        raise ValueError("bbox must be four comma-separated numbers: minx,miny,maxx,maxy")
+    if not (-180 <= minx < maxx <= 180 and -90 <= miny < maxy <= 90):
+        raise ValueError("bbox must be a non-empty WGS84 extent in minx,miny,maxx,maxy order")
+    return minx, miny, maxx, maxy
+
+
+async def find_service_by_teryt(file_path: str, teryt: str) -> Optional[Dict[str, str]]:
+    with registry_lookup_seconds.time():
+        return get_registry(file_path).first_service(teryt)
+
+
+async def find_services_by_teryt(file_path: str, teryt: str) -> List[Dict[str, str]]:
+    with registry_lookup_seconds.time():
+        return get_registry(file_path).services_for(teryt)
@@ -0,0 +1,113 @@
+import os
+import re
+import threading
+import time
+from typing import Optional, Dict, List
+
+from config import settings
+
+_URL_RE = re.compile(r'https?://.*?(?=https?://|$)')
+_CRS_RE = re.compile(r'^epsg:\d+$', re.IGNORECASE)
+
+
+class ServiceRegistry:
+    def __init__(self, file_path: str, check_interval: float = settings.REGISTRY_CHECK_INTERVAL):
+        self.file_path = file_path
+        self.check_interval = check_interval
+        self._services: Dict[str, List[Dict[str, str]]] = {}
+        self._by_url: Dict[str, List[Dict[str, str]]] = {}
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, List[Dict[str, str]]]:
+        with open(self.file_path, 'r', encoding='utf-8') as f:
+            f.readline()
+            lines = f.read().splitlines()
+
+        services: Dict[str, List[Dict[str, str]]] = {}
+        for line in lines:
+            row = [c.strip() for c in line.split(';')]
+            if len(row) < 4:
+                continue
+            teryts = [t.strip() for t in row[2].split(',')]
+            urls = _URL_RE.findall(row[3])
+            if len(teryts) != len(urls):
+                continue
+            for teryt, url in zip(teryts, urls):
+                if len(teryt) != 4 or not teryt.isdigit():
+                    continue
+                entries = services.setdefault(teryt, [])
+                if any(s['url'] == url for s in entries):
+                    continue
+                service = {
+                    'id': row[0],
+                    'organization': row[1],
+                    'teryt': teryt,
+                    'url': url
+                }
+                if len(row) > 5 and _CRS_RE.match(row[5]):
+                    service['crs'] = row[5].upper()
+                    service['axis'] = 'yx' if len(row) > 6 and row[6].lower() == 'yx' else 'xy'
+                entries.append(service)
+        return services
+
+    def _refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and self._mtime is not None and now - self._checked_at < self.check_interval:
+            return
+
+        with self._lock:
+            if not force and self._mtime is not None and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.file_path).st_mtime
+            except FileNotFoundError:
+                self._services = {}
+                self._by_url = {}
+                self._mtime = None
+                return
+            if not force and mtime == self._mtime:
+                return
+            services = self._read()
+            by_url: Dict[str, List[Dict[str, str]]] = {}
+            for entries in services.values():
+                for service in entries:
+                    by_url.setdefault(service['url'], []).append(service)
+            self._services, self._by_url = services, by_url
+            self._mtime = mtime
+
+    def reload(self) -> None:
+        self._refresh(force=True)
+
+    def services_for(self, teryt: str) -> List[Dict[str, str]]:
+        self._refresh()
+        return list(self._services.get(teryt, []))
+
+    def first_service(self, teryt: str) -> Optional[Dict[str, str]]:
+        self._refresh()
+        entries = self._services.get(teryt)
+        return entries[0] if entries else None
+
+    def services_for_url(self, url: str) -> List[Dict[str, str]]:
+        self._refresh()
+        return list(self._by_url.get(url, []))
+
+    def all_services(self) -> List[Dict[str, str]]:
+        self._refresh()
+        return [s for entries in self._services.values() for s in entries]
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._services)
+
+
+_registries: Dict[str, ServiceRegistry] = {}
+
+
+def get_registry(file_path: str = settings.WFS_DATA_FILE) -> ServiceRegistry:
+    registry = _registries.get(file_path)
+    if registry is None:
+        registry = _registries.setdefault(file_path, ServiceRegistry(file_path))
+    return registry